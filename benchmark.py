@@ -0,0 +1,249 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import resource
+import sys
+import time
+
+import chess
+
+import mcts, minimax
+from evaluation import evaluate, EvalBoard
+from quiescencesearch import quiescence_search
+from stats import SearchStats
+from cache import PositionCache
+from transposition_table import TranspositionTable
+from zobrist import ZobristBoard
+
+POSITIONS = {
+    'opening': "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    'middlegame': "r2q1rk1/pp2bppp/2n1bn2/3p4/3P4/2NBBN2/PP3PPP/R2Q1RK1 w - - 4 11",
+    'tactical': "r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4",
+    'endgame': "8/5k2/8/3K4/8/8/4P3/8 w - - 0 1",
+}
+
+# summary metrics checked against the baseline, True when higher is better
+SUMMARY_METRICS = {
+    'minimax_nps': True,
+    'minimax_seconds': False,
+    'mcts_iterations_per_second': True,
+    'playouts_per_second': True,
+    'quiescence_calls_per_second': True,
+    'push_evaluate_pop_per_second': True,
+    'incremental_push_evaluate_pop_per_second': True,
+}
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def bench_minimax(board, depth, workers, stats=None):
+    tt = TranspositionTable()
+    cache = PositionCache()
+    engine = minimax.Minimax(tt, workers=workers, stats=stats, cache=cache)
+    try:
+        move, score = engine.predict_iddfs(board, max_depth=depth)
+    finally:
+        engine.close()
+    return {
+        'move': move.uci() if move else None,
+        'score': score,
+        'nodes': engine.nodes,
+        'seconds': engine.elapsed,
+        'nps': engine.nps(),
+        'cutoffs': engine.cutoffs,
+        'time_to_depth': {str(d): t for d, t in engine.depth_times},
+        'tt_hit_rate': tt.hit_rate(),
+        'eval_cache_hit_rate': cache.evals.hit_rate(),
+        'move_cache_hit_rate': cache.moves.hit_rate(),
+    }
+
+def bench_scaling(depth, counts, positions=POSITIONS):
+    # minimax nps per worker count over every position, and the speedup over the first count
+    runs = {}
+    for workers in counts:
+        nodes = seconds = 0
+        with contextlib.redirect_stdout(sys.stderr):
+            for fen in positions.values():
+                result = bench_minimax(chess.Board(fen), depth, workers)
+                nodes += result['nodes']
+                seconds += result['seconds']
+        runs[str(workers)] = {'nodes': nodes, 'seconds': seconds, 'nps': nodes / seconds if seconds else 0.0}
+    base = runs[str(counts[0])]
+    for run in runs.values():
+        run['speedup'] = base['seconds'] / run['seconds'] if run['seconds'] else 0.0
+    return {'cpu_count': os.cpu_count(), 'depth': depth, 'workers': runs}
+
+def bench_mcts(board, iterations, stats=None):
+    tt = TranspositionTable()
+    cache = PositionCache()
+    engine = mcts.MCTS(tt, minimax.Minimax(tt, workers=1, stats=stats, cache=cache), stats=stats, cache=cache)
+    tree = engine.advance_root(board)
+    start = time.perf_counter()
+    move = engine.predict(tree, iterations=iterations)
+    elapsed = time.perf_counter() - start
+    return {
+        'move': move.uci() if move else None,
+        'iterations': int(tree.visits[0]),
+        'seconds': elapsed,
+        'iterations_per_second': int(tree.visits[0]) / elapsed if elapsed else 0.0,
+        'playouts_per_second': engine.playout.playouts_per_second(),
+        'tree_nodes': len(tree),
+    }
+
+def bench_quiescence(board, repeat):
+    board = EvalBoard.from_board(board)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        value = quiescence_search(board, float('-inf'), float('inf'))
+    elapsed = time.perf_counter() - start
+    return {'value': value, 'calls_per_second': repeat / elapsed if elapsed else 0.0}
+
+def bench_evaluate(board, repeat):
+    # push + evaluate + pop per second over the legal moves, as a search pays it:
+    # the running totals only help if keeping them up to date costs less than a rescan.
+    # Both boards keep a Zobrist key as the search's do, so only the evaluation differs.
+    results = {}
+    for name, position in (('plain', ZobristBoard(board.fen())), ('incremental', EvalBoard(board.fen()))):
+        moves = list(position.legal_moves)
+        if not moves:
+            results[name] = 0.0
+            continue
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for move in moves:
+                position.push(move)
+                evaluate(position)
+                position.pop()
+        elapsed = time.perf_counter() - start
+        results[name] = repeat * len(moves) / elapsed if elapsed else 0.0
+    return results
+
+def run(depth=3, iterations=300, repeat=200, workers=1, positions=POSITIONS, stats=None):
+    random.seed(0)
+    results = {'positions': {}}
+    totals = {'nodes': 0, 'minimax_seconds': 0.0, 'iterations': 0, 'mcts_seconds': 0.0}
+    playout_rates, quiescence_rates, eval_rates, incremental_rates = [], [], [], []
+
+    for name, fen in positions.items():
+        board = chess.Board(fen)
+        # engines print progress, keep stdout clean for the JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            result = {
+                'fen': fen,
+                'minimax': bench_minimax(board, depth, workers, stats),
+                'mcts': bench_mcts(board, iterations, stats),
+                'quiescence': bench_quiescence(board, repeat),
+                'evaluate': bench_evaluate(board, repeat),
+            }
+        result['peak_rss_kb'] = peak_rss_kb()
+        results['positions'][name] = result
+
+        totals['nodes'] += result['minimax']['nodes']
+        totals['minimax_seconds'] += result['minimax']['seconds']
+        totals['iterations'] += result['mcts']['iterations']
+        totals['mcts_seconds'] += result['mcts']['seconds']
+        playout_rates.append(result['mcts']['playouts_per_second'])
+        quiescence_rates.append(result['quiescence']['calls_per_second'])
+        eval_rates.append(result['evaluate']['plain'])
+        incremental_rates.append(result['evaluate']['incremental'])
+
+    mean = lambda values: sum(values) / len(values) if values else 0.0
+    results['summary'] = {
+        'minimax_nps': totals['nodes'] / totals['minimax_seconds'] if totals['minimax_seconds'] else 0.0,
+        'minimax_seconds': totals['minimax_seconds'],
+        'mcts_iterations_per_second': totals['iterations'] / totals['mcts_seconds'] if totals['mcts_seconds'] else 0.0,
+        'playouts_per_second': mean(playout_rates),
+        'quiescence_calls_per_second': mean(quiescence_rates),
+        'push_evaluate_pop_per_second': mean(eval_rates),
+        'incremental_push_evaluate_pop_per_second': mean(incremental_rates),
+        'peak_rss_kb': peak_rss_kb(),
+    }
+    results['config'] = {'depth': depth, 'iterations': iterations, 'repeat': repeat, 'workers': workers}
+    return results
+
+def best_of(summaries):
+    # best value of each metric over repeated runs: other load only ever slows a run
+    # down, so the best one is the least noisy estimate of the code's speed
+    best = dict(summaries[-1])
+    for metric, higher_is_better in SUMMARY_METRICS.items():
+        values = [summary[metric] for summary in summaries]
+        best[metric] = max(values) if higher_is_better else min(values)
+    return best
+
+def compare(results, baseline, tolerance):
+    # list of regressions worse than the tolerance, as readable strings
+    regressions = []
+    for metric, higher_is_better in SUMMARY_METRICS.items():
+        old = baseline.get('summary', {}).get(metric)
+        new = results['summary'].get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        if (change < -tolerance) if higher_is_better else (change > tolerance):
+            regressions.append(f"{metric}: {old:.6g} -> {new:.6g} ({change:+.0%})")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless search throughput benchmark")
+    parser.add_argument('--depth', type=int, default=3, help="minimax iterative deepening depth")
+    parser.add_argument('--iterations', type=int, default=300, help="MCTS iterations per position")
+    parser.add_argument('--repeat', type=int, default=200, help="calls per quiescence/evaluate measurement")
+    parser.add_argument('--workers', type=int, default=1, help="minimax worker processes")
+    parser.add_argument('--scaling', type=int, nargs='+', metavar='WORKERS',
+                        help="also time minimax with each of these worker counts, e.g. --scaling 1 2 4")
+    parser.add_argument('--runs', type=int, default=3, help="repeat the measurements, report the best run")
+    parser.add_argument('--quick', action='store_true', help="small budgets for a smoke run, never gated")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--baseline', help="JSON report to compare against")
+    parser.add_argument('--save-baseline', help="also write the report here as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed relative slowdown")
+    parser.add_argument('--trace', help="write per-search counters and MCTS phase times here (slower)")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.depth, args.iterations, args.repeat = 1, 50, 20
+
+    stats = SearchStats() if args.trace else None
+    # only the first run is traced, the counters would add up across runs
+    runs = [run(args.depth, args.iterations, args.repeat, args.workers, stats=stats if i == 0 else None)
+            for i in range(max(args.runs, 1))]
+    results = runs[0]
+    results['summary'] = best_of([result['summary'] for result in runs])
+    results['config']['runs'] = len(runs)
+    if args.scaling:
+        results['scaling'] = bench_scaling(args.depth, args.scaling)
+    if stats is not None:
+        stats.export(args.trace)
+        print(stats.report(), file=sys.stderr)
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    else:
+        print(report)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            f.write(report)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != results['config']:
+            print("warning: baseline was recorded with a different config", file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions and args.quick:
+            # millisecond timings swing by more than any sensible tolerance
+            print("warning: --quick timings are too small to gate on, not failing for:", file=sys.stderr)
+            for regression in regressions:
+                print("  " + regression, file=sys.stderr)
+        elif regressions:
+            print("PERFORMANCE REGRESSION:", file=sys.stderr)
+            for regression in regressions:
+                print("  " + regression, file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+import argparse
+import mmap
+import random
+import struct
+import sys
+
+import chess
+import chess.pgn
+
+from tree import encode_move, decode_move
+from zobrist import zobrist_hash
+
+MAGIC = b'MMBOOK01'
+HEADER = struct.Struct('<8sQ')  # magic, number of slots
+RECORD = struct.Struct('<QHHiI')  # zobrist key, move, depth, score, count
+
+class BookEntry:
+    __slots__ = ('move', 'depth', 'score', 'count')
+
+    def __init__(self, move, depth, score, count):
+        self.move = move
+        self.depth = depth
+        self.score = score  # centipawns for the side to move
+        self.count = count  # games or searches that chose the move
+
+
+class OpeningBook:
+    # read-only open addressing hash table in a memory-mapped file,
+    # one slot per position so a probe is a single hash and a few reads
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.slots = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an opening book")
+        self.mask = self.slots - 1
+
+        self.probes = 0
+        self.hits = 0
+
+    def __reduce__(self):
+        # mmaps do not pickle, worker processes map the file themselves
+        return (OpeningBook, (self.path,))
+
+    def __len__(self):
+        return sum(1 for i in range(self.slots) if self.read(i)[0])
+
+    def close(self):
+        self.data.close()
+
+    def read(self, slot):
+        return RECORD.unpack_from(self.data, HEADER.size + slot * RECORD.size)
+
+    def lookup(self, key):
+        self.probes += 1
+        slot = key & self.mask
+        while True:
+            stored, move, depth, score, count = self.read(slot)
+            if stored == 0:
+                return None
+            if stored == key:
+                self.hits += 1
+                return BookEntry(decode_move(move), depth, score, count)
+            slot = (slot + 1) & self.mask
+
+    def probe(self, board, choices=None):
+        # book move for the position if it is legal (and one of the choices)
+        key = getattr(board, 'zobrist_key', None)
+        if key is None:
+            key = zobrist_hash(board)
+        entry = self.lookup(key)
+        if entry is None or not board.is_legal(entry.move):
+            return None
+        if choices is not None and entry.move not in choices:
+            return None
+        return entry
+
+
+class BookBuilder:
+    def __init__(self):
+        self.positions = {}  # key -> {encoded move: [count, score total, depth]}
+
+    def add(self, board, move, score=0, depth=0):
+        moves = self.positions.setdefault(zobrist_hash(board), {})
+        stats = moves.setdefault(encode_move(move), [0, 0, 0])
+        stats[0] += 1
+        stats[1] += score
+        stats[2] = max(stats[2], depth)
+
+    def add_game(self, game, max_ply=20):
+        # every position of the main line, scored by the game result
+        result = {'1-0': 1, '0-1': -1}.get(game.headers.get('Result'), 0)
+        board = game.board()
+        for ply, move in enumerate(game.mainline_moves()):
+            if ply >= max_ply:
+                break
+            outcome = result if board.turn == chess.WHITE else -result
+            self.add(board, move, 100 * outcome)
+            board.push(move)
+
+    def add_pgn(self, path, max_ply=20):
+        games = 0
+        with open(path) as f:
+            while True:
+                game = chess.pgn.read_game(f)
+                if game is None:
+                    break
+                self.add_game(game, max_ply)
+                games += 1
+        return games
+
+    def add_selfplay(self, engine, games=10, max_ply=16, depth=4, random_plies=2, seed=0):
+        # search every position of short self-play games, random first moves for variety
+        rng = random.Random(seed)
+        for _ in range(games):
+            board = chess.Board()
+            for ply in range(max_ply):
+                if board.is_game_over():
+                    break
+                if ply < random_plies:
+                    move = rng.choice(list(board.legal_moves))
+                else:
+                    move, score = engine.predict_iddfs(board, max_depth=depth)
+                    self.add(board, move, score, depth)
+                board.push(move)
+
+    def write(self, path):
+        slots = 16
+        while slots < 2 * len(self.positions):
+            slots *= 2
+        mask = slots - 1
+        table = bytearray(HEADER.size + slots * RECORD.size)
+        HEADER.pack_into(table, 0, MAGIC, slots)
+        used = [False] * slots
+
+        for key, moves in self.positions.items():
+            # the most chosen move, then the deepest, then the best scored
+            move, (count, total, depth) = max(moves.items(),
+                                              key=lambda item: (item[1][0], item[1][2], item[1][1] / item[1][0]))
+            slot = key & mask
+            while used[slot]:
+                slot = (slot + 1) & mask
+            used[slot] = True
+            RECORD.pack_into(table, HEADER.size + slot * RECORD.size, key, move, depth, total // count, count)
+
+        with open(path, 'wb') as f:
+            f.write(table)
+        return len(self.positions)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build an opening book from PGN files or self-play")
+    parser.add_argument('output', help="book file to write")
+    parser.add_argument('--pgn', nargs='*', default=[], help="PGN files to read")
+    parser.add_argument('--max-ply', type=int, default=20, help="positions per game to keep")
+    parser.add_argument('--selfplay', type=int, default=0, help="number of self-play games to search")
+    parser.add_argument('--depth', type=int, default=4, help="search depth for self-play positions")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    builder = BookBuilder()
+    for path in args.pgn:
+        games = builder.add_pgn(path, args.max_ply)
+        print(f"{path}: {games} games", file=sys.stderr)
+    if args.selfplay:
+        from minimax import Minimax
+        engine = Minimax(workers=1)
+        builder.add_selfplay(engine, args.selfplay, args.max_ply, args.depth, seed=args.seed)
+    positions = builder.write(args.output)
+    print(f"wrote {positions} positions to {args.output}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
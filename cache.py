@@ -0,0 +1,131 @@
+from collections import OrderedDict
+
+import chess
+
+from evaluation import EvalBoard, MATE_SCORE, material_and_psqt, search_ply
+from quiescencesearch import get_captures_and_promotions
+from zobrist import zobrist_hash
+
+MATED = -MATE_SCORE  # cached for a mated side to move, the ply is added on the way out
+
+def position_key(board):
+    key = getattr(board, 'zobrist_key', None)
+    return zobrist_hash(board) if key is None else key
+
+
+class LRUCache:
+    # bounded key -> value map, the least recently used entry is evicted first
+    def __init__(self, size=1 << 16):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def hit_rate(self):
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0
+
+    def stats(self):
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate()}
+
+
+class PositionCache:
+    # evaluations and move lists by Zobrist key, shared by the searches that
+    # are given it. Only what the key fully determines is cached: the
+    # repetition and seventy-five move rules depend on the game history and
+    # are checked on every call.
+    def __init__(self, eval_size=1 << 16, moves_size=1 << 15):
+        self.evals = LRUCache(eval_size)  # key -> side to move score, mates and stalemates included
+        # key -> [any legal move, legal moves, ordered captures], each None until asked for,
+        # so a stand pat cutoff never pays for a full move generation
+        self.moves = LRUCache(moves_size)
+
+    def clear(self):
+        self.evals.clear()
+        self.moves.clear()
+
+    def entry(self, board):
+        key = position_key(board)
+        entry = self.moves.get(key)
+        if entry is None:
+            entry = [None, None, None]
+            self.moves.put(key, entry)
+        return entry
+
+    def has_legal_moves(self, board):
+        entry = self.entry(board)
+        if entry[0] is None:
+            entry[0] = bool(entry[1]) if entry[1] is not None else any(board.generate_legal_moves())
+        return entry[0]
+
+    def legal_moves(self, board):
+        entry = self.entry(board)
+        if entry[1] is None:
+            entry[1] = tuple(board.generate_legal_moves())
+            entry[0] = bool(entry[1])
+        return entry[1]
+
+    def captures(self, board):
+        # ordered like get_captures_and_promotions
+        entry = self.entry(board)
+        if entry[2] is None:
+            entry[2] = tuple(get_captures_and_promotions(board))
+        return entry[2]
+
+    def is_terminal(self, board):
+        # board.is_game_over() without generating the moves again
+        if not self.has_legal_moves(board):
+            return True
+        return board.is_insufficient_material() or board.is_seventyfive_moves() or board.is_fivefold_repetition()
+
+    def evaluate(self, board):
+        # same scores as evaluation.evaluate
+        key = position_key(board)
+        score = self.evals.get(key)
+        if score is None:
+            score = self.static_score(board)
+            self.evals.put(key, score)
+        if score == MATED:
+            return -MATE_SCORE + search_ply(board)  # the side to move is mated, sooner is worse
+        if board.is_seventyfive_moves() or board.is_fivefold_repetition():
+            return 0
+        return score
+
+    def static_score(self, board):
+        if not self.has_legal_moves(board):
+            return MATED if board.is_check() else 0
+        if board.is_insufficient_material():
+            return 0
+        if isinstance(board, EvalBoard):
+            material, psqt = board.material, board.psqt
+        else:
+            material, psqt = material_and_psqt(board)
+        score = material + psqt
+        return score if board.turn == chess.WHITE else -score
+
+    def hit_rate(self):
+        return {'eval': self.evals.hit_rate(), 'moves': self.moves.hit_rate()}
+
+    def stats(self):
+        return {'eval': self.evals.stats(), 'moves': self.moves.stats()}
@@ -2,10 +2,7 @@ import pygame
 import chess
 import sys
 
-from node import Node
-import threading
-
-speed = 60
+POLL_MS = 50  # how long the UI sleeps between reads of the engine's queue while it thinks
 
 white = (255, 255, 255)
 yellow = (235, 236, 208)
@@ -14,7 +11,10 @@ black = (0, 0, 0)
 blue = (50, 80, 160, 150)
 
 class ChessView:
-    def __init__(self, board, player, ai, width, height):
+    # event driven: the loop sleeps until there is input or engine progress and
+    # only the squares that changed are repainted. The AI is an EngineProcess,
+    # so the search never competes with the UI for the GIL.
+    def __init__(self, board, player, engine, width, height, movetime=10, iterations=1000):
         self.width = width
         self.height = height
         self.size = self.width // 8
@@ -23,16 +23,17 @@ class ChessView:
         self.dragging = None
         self.board = board 
         self.player = player
-        self.ai = ai
+        self.engine = engine
         self.valid_moves = {}  # Dictionary to store valid moves for a selected piece
-        self.board = board
-        self.thread = None
+        self.movetime = movetime  # seconds the AI may think per move
+        self.iterations = iterations
+        self.shown = {}  # square -> piece as last drawn
+        self.dirty = set(chess.SQUARES)  # squares to repaint on the next draw
 
         pygame.init()
         pygame.font.init()
         pygame.display.set_caption('Chess AI')
         self.screen = pygame.display.set_mode((width, height)) 
-        self.clock = pygame.time.Clock()
         self.screen.fill((0, 0, 0))
         self.font = pygame.font.SysFont("Georgia", 20)
 
@@ -42,37 +43,58 @@ class ChessView:
 
     def run(self):
         self.running = True
-        while self.running:
-            self.events()
-            self.update()
-            self.draw()
-
-            if not self.board.turn == self.player:
-                if self.thread is None:
-                    self.thread = threading.Thread(target=self.ai_turn)
-                    self.thread.start()
-
+        try:
+            while self.running:
+                if not self.engine.searching and self.board.turn != self.player and not self.board.is_game_over():
+                    self.ai_turn()
+                self.draw()
+                self.events()
+        finally:
+            self.engine.close()
         pygame.quit()
         sys.exit()
 
     def ai_turn(self):
-        if not (self.board.is_game_over() or self.board.turn == self.player):
-            root = Node(self.board)
-            best_move = self.ai.predict(root, iterations=1000, minimax=True)
-            self.board.push(best_move) 
-            print("AI played:", best_move)
-            self.thread = None
+        # the engine process searches while the UI keeps sleeping between events
+        self.engine.search(self.board, iterations=self.iterations, minimax=True, movetime=self.movetime)
+        pygame.display.set_caption('Chess AI - thinking')
+
+    def engine_messages(self):
+        for message in self.engine.poll():
+            if message[0] == 'progress':
+                _, move, depth, nodes = message
+                pygame.display.set_caption(f"Chess AI - thinking: {move} depth {depth}, {nodes} nodes")
+            elif message[0] == 'bestmove':
+                best_move = message[1]
+                if best_move is not None:
+                    self.board.push(best_move)
+                    self.moved()
+                print("AI played:", best_move)
+                pygame.display.set_caption('Chess AI')
 
     def events(self):
-        for event in pygame.event.get():
+        # blocks until input arrives, or at most POLL_MS while the engine is searching
+        first = pygame.event.wait(POLL_MS) if self.engine.searching else pygame.event.wait()
+        for event in [first] + pygame.event.get():
             if event.type == pygame.QUIT:
                 self.running = False
+            elif event.type == pygame.VIDEOEXPOSE:
+                self.dirty.update(chess.SQUARES)
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button == 1:  # Left mouse button
                     self.handle_mouse_down(event.pos)
             elif event.type == pygame.MOUSEBUTTONUP:
                 if event.button == 1:  # Left mouse button
                     self.handle_mouse_up(event.pos)
+        if self.engine.searching:
+            self.engine_messages()
+
+    def moved(self):
+        # mark the squares whose piece differs from what is on screen
+        pieces = self.board.piece_map()
+        self.dirty.update(square for square in self.shown.keys() | pieces.keys()
+                          if self.shown.get(square) != pieces.get(square))
+        self.shown = pieces
 
         if not self.result and self.board.is_game_over():
             print("Game Over!") 
@@ -81,48 +103,45 @@ class ChessView:
             self.result = True
 
     def draw(self):
-        self.screen.fill(black)
-        self.draw_board()
-        self.draw_pieces()
-        if self.dragging:
-            self.highlight_valid_moves()
-
-    def update(self):
-        pygame.display.update()
-        self.clock.tick(speed)
-
-    def draw_board(self):
-        # Draw the chess board
-        for row in range(8):
-            for col in range(8):
-                square_color = yellow if (row + col) % 2 == 0 else green
-                pygame.draw.rect(self.screen, square_color, (col * self.size, row * self.size, self.size, self.size))
-
-    def draw_pieces(self):
-        # Draw chess pieces on the board
-        for row in range(8):
-            for col in range(8):
-                square = chess.square(col, 7 - row) # chess row is reversed
-                piece = self.board.piece_at(square)
-                if piece:
-                    piece_image = self.piece_images[piece.symbol()]
-                    piece_rect = piece_image.get_rect()
-                    x, y = ((col*self.size)+self.size//4), ((row*self.size)+self.size//4)
-                    piece_rect.topleft = (x, y)
-                    self.screen.blit(piece_image, piece_rect)
+        if not self.dirty:
+            return
+        if not self.shown:
+            self.shown = self.board.piece_map()
+        rects = [self.draw_square(square) for square in self.dirty]
+        pygame.display.update(rects)
+        self.dirty.clear()
+
+    def draw_square(self, square):
+        # background, piece and move highlight of one square, returns its screen rect
+        col, row = chess.square_file(square), 7 - chess.square_rank(square)  # chess row is reversed
+        rect = pygame.Rect(col * self.size, row * self.size, self.size, self.size)
+        pygame.draw.rect(self.screen, yellow if (row + col) % 2 == 0 else green, rect)
+        piece = self.shown.get(square)
+        if piece:
+            piece_image = self.piece_images[piece.symbol()]
+            piece_rect = piece_image.get_rect()
+            piece_rect.topleft = ((col*self.size)+self.size//4), ((row*self.size)+self.size//4)
+            self.screen.blit(piece_image, piece_rect)
+        if square in self.valid_moves:
+            self.circle_fill(rect.center, blue, 25)
+        return rect
 
     def handle_mouse_down(self, pos):
+        if self.engine.searching or self.board.turn != self.player:
+            return
         col = pos[0] // self.size
         row = pos[1] // self.size
         square = chess.square(col, 7 - row)
         piece = self.board.piece_at(square)
 
         if piece and piece.color == self.board.turn:
+            self.dirty.update(self.valid_moves)
             self.dragging = square
             self.valid_moves = {move.to_square: move for move in self.board.legal_moves if move.from_square == square}
+            self.dirty.update(self.valid_moves)
 
     def handle_mouse_up(self, pos):
-        if self.dragging:
+        if self.dragging is not None:
             col = pos[0] // self.size
             row = pos[1] // self.size
             target_square = chess.square(col, 7 - row)
@@ -130,16 +149,12 @@ class ChessView:
             if target_square in self.valid_moves:
                 move = self.valid_moves[target_square]
                 self.board.push(move)
+                self.moved()
 
+            self.dirty.update(self.valid_moves)  # clear the highlights
             self.dragging = None
             self.valid_moves = {}
 
-    def highlight_valid_moves(self):
-        for target_square in self.valid_moves:
-            col, row = chess.square_file(target_square), 7 - chess.square_rank(target_square)
-            center = ((col*self.size)+self.size//2, (row*self.size)+self.size//2)
-            self.circle_fill(center, blue, 25)
-
     def reset(self):
         pass
 
@@ -0,0 +1,66 @@
+import multiprocessing
+import queue
+
+from timecontrol import SearchLimits
+
+def _serve(factory, requests, results):
+    # runs in the engine process: builds the engine once, answers search requests until None
+    engine = factory()
+    engine.progress = lambda move, depth, nodes: results.put(('progress', move, depth, nodes))
+    try:
+        for board, iterations, minimax, movetime in iter(requests.get, None):
+            root = engine.advance_root(board)  # keeps last move's statistics
+            limits = SearchLimits(movetime=movetime) if movetime else None
+            move = engine.predict(root, iterations=iterations, minimax=minimax, limits=limits)
+            results.put(('bestmove', move))
+    finally:
+        for part in (engine, getattr(engine, 'mm', None)):
+            close = getattr(part, 'close', None)
+            if close is not None:
+                close()
+
+
+class EngineProcess:
+    # an MCTS engine in its own process, so a UI never shares the GIL with the
+    # search. factory builds the engine there and has to be picklable (a module
+    # level function); progress and the chosen move come back through a queue as
+    # ('progress', move, depth, nodes) and ('bestmove', move) messages.
+    # Start it before any UI library is initialised, a forked process inherits it.
+    def __init__(self, factory):
+        self.requests = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        # not a daemon: the engine's minimax may start a worker pool of its own
+        self.process = multiprocessing.Process(target=_serve, args=(factory, self.requests, self.results),
+                                               name='engine')
+        self.process.start()
+        self.searching = False
+
+    def search(self, board, iterations=1000, minimax=False, movetime=None):
+        # starts a search on a copy of board and returns at once
+        self.requests.put((board.copy(), iterations, minimax, movetime))
+        self.searching = True
+
+    def poll(self, timeout=None):
+        # messages received so far; waits up to timeout seconds for the first one, never if None
+        messages = []
+        try:
+            if timeout is not None:
+                messages.append(self.results.get(timeout=timeout))
+            while True:
+                messages.append(self.results.get_nowait())
+        except queue.Empty:
+            pass
+        if any(message[0] == 'bestmove' for message in messages):
+            self.searching = False
+        return messages
+
+    def close(self, timeout=1.0):
+        # a search still running is not waited for
+        if self.process.is_alive():
+            self.requests.put(None)
+            self.process.join(0 if self.searching else timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+        self.requests.close()
+        self.results.close()
@@ -1,4 +1,9 @@
 import chess
+import numpy as np
+
+from zobrist import ZobristBoard
+
+popcount = chess.popcount
  
 def is_terminal(state):
     return state.is_game_over() or state.is_stalemate()
@@ -87,43 +92,237 @@ PIECE_SQUARE_TABLES = {
     chess.KING: king_table
 }
 
+# the tables are written from white's side with rank 8 first, python-chess
+# numbers a1 as square 0, so white reads them mirrored and black as they are
+WHITE_PSQT = {
+    piece_type: [table[square ^ 56] for square in chess.SQUARES]
+    for piece_type, table in PIECE_SQUARE_TABLES.items()
+}
+BLACK_PSQT = PIECE_SQUARE_TABLES
+
+def value_masks(table, sign=1):
+    # squares grouped by table value, so a piece set scores with one popcount per value
+    masks = {}
+    for square, value in enumerate(table):
+        if value:
+            masks[value] = masks.get(value, 0) | chess.BB_SQUARES[square]
+    return tuple((sign * value, mask) for value, mask in masks.items())
+
+# piece type -> (white (value, mask) pairs, black pairs with the sign flipped)
+PSQT_MASKS = {
+    piece_type: (value_masks(WHITE_PSQT[piece_type]), value_masks(BLACK_PSQT[piece_type], -1))
+    for piece_type in PIECE_VALUES
+}
+
+# (768,) weights over 12 piece planes of 64 squares, white pawn..king then
+# black pawn..king, for scoring unpacked bitboards with one matrix product
+# (float32 products are faster than integer ones and exact at these sizes)
+BATCH_WEIGHTS = np.array(
+    [PIECE_VALUES[piece_type] + WHITE_PSQT[piece_type][square]
+     for piece_type in PIECE_VALUES for square in chess.SQUARES] +
+    [-(PIECE_VALUES[piece_type] + BLACK_PSQT[piece_type][square])
+     for piece_type in PIECE_VALUES for square in chess.SQUARES],
+    dtype=np.float32)
+
+MATE_SCORE = 100000
+
+def search_ply(board):
+    # plies since the search root, which a search records on its board as
+    # root_ply; outside a search the board's own position is the root
+    return len(board.move_stack) - getattr(board, 'root_ply', len(board.move_stack))
+
+def piece_sets(board):
+    return (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings)
+
 def evaluate_board(state, player_colour):
-    piece_values = {
-        'P': 1, 'N': 3, 'B': 3, 'R': 5, 'Q': 9, 'K': 10,
-        'p': -1, 'n': -3, 'b': -3, 'r': -5, 'q': -9, 'k': -10
-    }
+    # material balance in pawns from player_colour's side (chess.WHITE or chess.BLACK)
+    black, white = state.occupied_co
+    score = 0
+    for value, pieces in ((1, state.pawns), (3, state.knights), (3, state.bishops), (5, state.rooks), (9, state.queens)):
+        score += value * (popcount(pieces & white) - popcount(pieces & black))
+    return score if player_colour == chess.WHITE else -score
 
-    total_score = 0
-    for _, piece in state.piece_map().items():
-        piece_value = piece_values.get(piece.symbol(), 0)
-        if piece.color == player_colour:
-            total_score += piece_value
-        else:
-            total_score -= piece_value
+def material_and_psqt(board):
+    # full rescan on the bitboards: white minus black material and piece-square totals
+    material = 0
+    psqt = 0
+    black, white = board.occupied_co
+    for piece_type, pieces in zip(PIECE_VALUES, piece_sets(board)):
+        if not pieces:
+            continue
+        own, enemy = pieces & white, pieces & black
+        material += PIECE_VALUES[piece_type] * (popcount(own) - popcount(enemy))
+        white_masks, black_masks = PSQT_MASKS[piece_type]
+        if own:
+            for value, mask in white_masks:
+                if own & mask:
+                    psqt += value * popcount(own & mask)
+        if enemy:
+            for value, mask in black_masks:
+                if enemy & mask:
+                    psqt += value * popcount(enemy & mask)
+    return material, psqt
 
-    return total_score
+def bitboard_planes(boards):
+    # (N, 12) uint64 piece bitboards in BATCH_WEIGHTS order
+    values = []
+    extend = values.extend
+    for board in boards:
+        black, white = board.occupied_co
+        p, n, b, r, q, k = piece_sets(board)
+        extend((p & white, n & white, b & white, r & white, q & white, k & white,
+                p & black, n & black, b & black, r & black, q & black, k & black))
+    return np.array(values, dtype='<u8').reshape(-1, 12)
+
+def evaluate_batch(boards, weights=BATCH_WEIGHTS):
+    # static material + piece-square scores of many positions at once, each from
+    # its side to move like evaluate, but without the game over checks
+    planes = bitboard_planes(boards)
+    bits = np.unpackbits(planes.view(np.uint8), axis=1, bitorder='little')  # bit i = plane i // 64, square i % 64
+    scores = (bits.astype(np.float32) @ weights).astype(np.int64)
+    white_to_move = np.fromiter((board.turn for board in boards), dtype=bool, count=len(planes))
+    return np.where(white_to_move, scores, -scores)
 
 def evaluate(board):
-    # Handle special cases concisely
+    # score for the side to move, as negamax and quiescence search expect
     if board.is_game_over():
-        return 9999 * board.turn
-    
-    if board.is_stalemate() or board.is_insufficient_material():
+        if board.is_checkmate():
+            return -MATE_SCORE + search_ply(board)  # the side to move is mated, sooner is worse
         return 0  # Draw
 
-    # Calculate material difference efficiently
-    piece_difference = sum(
-        PIECE_VALUES[piece_type] * (len(board.pieces(piece_type, chess.WHITE)) - len(board.pieces(piece_type, chess.BLACK)))
-        for piece_type in PIECE_VALUES
-    )
-
-    # Iterate through pieces and piece-square tables in a single loop
-    total_score = 0
-    for piece_type in PIECE_VALUES:
-        piece_square_table = PIECE_SQUARE_TABLES[piece_type]
-        for square in board.pieces(piece_type, chess.WHITE):
-            total_score += piece_square_table[square]
-        for square in board.pieces(piece_type, chess.BLACK):
-            total_score -= piece_square_table[square]  # Reflect black's perspective
-
-    return total_score + piece_difference * board.turn  # Factor in turn directly
\ No newline at end of file
+    if isinstance(board, EvalBoard):
+        material, psqt = board.material, board.psqt  # kept up to date on push/pop
+    else:
+        material, psqt = material_and_psqt(board)
+
+    score = material + psqt
+    return score if board.turn == chess.WHITE else -score
+
+
+class EvalBoard(ZobristBoard):
+    # keeps material and piece-square totals as running sums,
+    # updated from each move instead of rescanning the board in evaluate
+
+    def clear_stack(self):
+        super().clear_stack()
+        self._eval_stack = []
+        self.material, self.psqt = material_and_psqt(self)
+
+    def push(self, move):
+        self._eval_stack.append((self.material, self.psqt))
+        if move:  # a null move changes no pieces
+            self.material, self.psqt = self.move_delta(move)
+        super().push(move)
+
+    def pop(self):
+        move = super().pop()
+        self.material, self.psqt = self._eval_stack.pop()
+        return move
+
+    def move_delta(self, move):
+        sign = 1 if self.turn == chess.WHITE else -1
+        own, enemy = (WHITE_PSQT, BLACK_PSQT) if self.turn == chess.WHITE else (BLACK_PSQT, WHITE_PSQT)
+        from_square, to_square = move.from_square, move.to_square
+        piece_type = self.piece_type_at(from_square)
+        material, psqt = self.material, self.psqt
+
+        if piece_type == chess.KING and self.is_castling(move):
+            # move the rook as well, chess960 encodes castling as king takes rook
+            rank = chess.square_rank(from_square)
+            kingside = self.is_kingside_castling(move)
+            rook_from = to_square
+            if not (self.rooks & self.occupied_co[self.turn] & chess.BB_SQUARES[to_square]):
+                rook_from = chess.square(7 if kingside else 0, rank)
+            rook_to = chess.square(5 if kingside else 3, rank)
+            to_square = chess.square(6 if kingside else 2, rank)
+            psqt += sign * (own[chess.ROOK][rook_to] - own[chess.ROOK][rook_from])
+        else:
+            capture_square = to_square
+            if piece_type == chess.PAWN and self.is_en_passant(move):
+                capture_square = to_square - 8 * sign
+            captured = self.piece_type_at(capture_square)
+            if captured:
+                material += sign * PIECE_VALUES[captured]
+                psqt += sign * enemy[captured][capture_square]
+
+        promoted = move.promotion or piece_type
+        material += sign * (PIECE_VALUES[promoted] - PIECE_VALUES[piece_type])
+        psqt += sign * (own[promoted][to_square] - own[piece_type][from_square])
+        return material, psqt
+
+    def copy(self, *, stack=True):
+        board = super().copy(stack=stack)
+        board.material, board.psqt = self.material, self.psqt
+        if stack:
+            stack = len(self.move_stack) if stack is True else stack
+            board._eval_stack = self._eval_stack[-stack:] if stack else []
+        else:
+            board._eval_stack = []
+        return board
+
+
+def benchmark(positions=200, moves=40, repeat=20):
+    # compare rescanning against the running totals on random game positions
+    import random
+    import time
+
+    random.seed(0)
+    boards = []
+    for _ in range(positions):
+        board = EvalBoard()
+        for _ in range(random.randint(1, moves)):
+            legal_moves = list(board.legal_moves)
+            if not legal_moves:
+                break
+            board.push(random.choice(legal_moves))
+        boards.append(board)
+
+    plain = [chess.Board(board.fen()) for board in boards]
+    for board, reference in zip(boards, plain):
+        assert evaluate(board) == evaluate(reference), board.fen()
+    live = [board for board in plain if not board.is_game_over()]
+    assert list(evaluate_batch(live)) == [evaluate(board) for board in live]
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for board in plain:
+            material_and_psqt(board)
+    rescan = time.perf_counter() - start
+
+    # what a search pays per node: the move, the evaluation and the undo. The
+    # search always runs on a ZobristBoard, so that with a rescan is the baseline
+    # for EvalBoard; push+pop alone shows what the Zobrist update costs on top
+    # of chess.Board.
+    def per_move(group, evaluated):
+        moves = [list(board.legal_moves)[:4] for board in group]
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for board, board_moves in zip(group, moves):
+                for move in board_moves:
+                    board.push(move)
+                    if evaluated:
+                        evaluate(board)
+                    board.pop()
+        return (time.perf_counter() - start) / (repeat * sum(map(len, moves)))
+
+    zobrist = [ZobristBoard(board.fen()) for board in boards]
+    timings = {
+        'push+pop on chess.Board': per_move(plain, False),
+        'push+pop on ZobristBoard': per_move(zobrist, False),
+        'push+evaluate+pop on ZobristBoard (rescan)': per_move(zobrist, True),
+        'push+evaluate+pop on EvalBoard (running totals)': per_move(boards, True),
+    }
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        evaluate_batch(plain)
+    batch = time.perf_counter() - start
+
+    calls = positions * repeat
+    print(f"rescan: {rescan / calls * 1e6:.2f} us/eval")
+    print(f"batch of {positions}: {batch / calls * 1e6:.2f} us/eval")
+    for name, seconds in timings.items():
+        print(f"{name}: {seconds * 1e6:.2f} us/move")
+
+if __name__ == "__main__":
+    benchmark()
@@ -1,16 +1,32 @@
+import os
+
 import chess
 import mcts, minimax
 from draw import ChessView
+from engine_process import EngineProcess
 
 from transposition_table import TranspositionTable
+from book import OpeningBook
+from cache import PositionCache
+from tablebase import Tablebase
+
+BOOK_PATH = "opening.book"  # built with: python book.py opening.book --pgn games.pgn
+SYZYGY_PATH = "syzygy"  # directory of Syzygy .rtbw/.rtbz files, optional
+
+def make_engine():
+    # called in the engine process, so the tables and caches live there
+    tt = TranspositionTable()
+    book = OpeningBook(BOOK_PATH) if os.path.exists(BOOK_PATH) else None
+    cache = PositionCache()
+    tablebase = Tablebase(SYZYGY_PATH) if os.path.isdir(SYZYGY_PATH) else None
+    mm = minimax.Minimax(tt, book=book, cache=cache, tablebase=tablebase)
+    return mcts.MCTS(tt, mm, book=book, cache=cache, tablebase=tablebase)
 
 def run(chessView):
     chessView.run()
 
 if __name__ == "__main__":
-    tt = TranspositionTable()
-    mm = minimax.Minimax(tt)
-    monte_carlo = mcts.MCTS(tt, mm)
+    engine = EngineProcess(make_engine)  # before pygame starts, see EngineProcess
     board = chess.Board()
-    chessView = ChessView(board, chess.BLACK, monte_carlo, 1000, 1000)
-    run(chessView)
\ No newline at end of file
+    chessView = ChessView(board, chess.BLACK, engine, 1000, 1000)
+    run(chessView)
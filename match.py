@@ -0,0 +1,218 @@
+import argparse
+import contextlib
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import chess
+import chess.pgn
+
+# engines only, never draw/pygame: this has to run on machines without a display
+import mcts, minimax, puct
+from timecontrol import SearchLimits
+from transposition_table import TranspositionTable
+from cache import PositionCache
+
+DEFAULTS = {
+    'mcts': {'iterations': 300, 'minimax': False, 'C': 2},
+    'minimax': {'depth': 3},
+    'puct': {'iterations': 1000, 'batch_size': 16, 'c_puct': 1.5},
+}
+
+def parse_engine(spec):
+    # "mcts:iterations=500,C=1.4" -> {'engine': 'mcts', 'iterations': 500, 'C': 1.4}
+    name, _, options = spec.partition(':')
+    if name not in DEFAULTS:
+        raise argparse.ArgumentTypeError(f"unknown engine {name!r}, expected one of {', '.join(DEFAULTS)}")
+    config = dict(DEFAULTS[name], engine=name)
+    for option in filter(None, options.split(',')):
+        key, _, value = option.partition('=')
+        config[key] = parse_value(value)
+    return config
+
+def parse_value(value):
+    if value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    for kind in (int, float):
+        try:
+            return kind(value)
+        except ValueError:
+            pass
+    return value
+
+def engine_name(config):
+    options = ','.join(f"{key}={value}" for key, value in config.items() if key != 'engine')
+    return f"{config['engine']}:{options}" if options else config['engine']
+
+
+class Player:
+    # one engine with its own transposition table, so the two sides share nothing
+    def __init__(self, config):
+        self.config = config
+        tt = TranspositionTable()
+        cache = PositionCache()
+        # pool workers are daemonic and cannot start their own pools
+        self.mm = minimax.Minimax(tt, workers=1, cache=cache)
+        if config['engine'] == 'mcts':
+            self.mcts = mcts.MCTS(tt, self.mm, C=config.get('C', 2), cache=cache)
+        elif config['engine'] == 'puct':
+            self.mcts = puct.PUCT(tt, self.mm, batch_size=config.get('batch_size', 16),
+                                  c_puct=config.get('c_puct', 1.5), cache=cache)
+        else:
+            self.mcts = None
+
+    def move(self, board, movetime=None):
+        limits = SearchLimits(movetime=movetime) if movetime else None
+        if self.mcts is not None:
+            root = self.mcts.advance_root(board)
+            return self.mcts.predict(root, iterations=self.config['iterations'],
+                                     minimax=self.config.get('minimax', False), limits=limits)
+        move, _ = self.mm.predict_iddfs(board, max_depth=self.config['depth'], limits=limits)
+        return move
+
+
+def play_game(args):
+    # runs in a pool worker: one full game, returned as plain data
+    index, white, black, movetime, opening_plies, max_plies, seed = args
+    rng = random.Random(seed)
+    board = chess.Board()
+    players = {chess.WHITE: Player(white), chess.BLACK: Player(black)}
+    start = time.time()
+
+    # random opening moves so repeated pairings do not replay the same game
+    for _ in range(opening_plies):
+        moves = list(board.legal_moves)
+        if not moves or board.is_game_over():
+            break
+        board.push(rng.choice(moves))
+
+    termination = None
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        while True:
+            outcome = board.outcome(claim_draw=True)
+            if outcome is not None:
+                result, termination = outcome.result(), outcome.termination.name.lower()
+                break
+            if board.ply() >= max_plies:
+                result, termination = '1/2-1/2', 'max_plies'
+                break
+            move = players[board.turn].move(board, movetime)
+            if move is None or not board.is_legal(move):
+                # an engine that cannot produce a legal move forfeits
+                result = '0-1' if board.turn == chess.WHITE else '1-0'
+                termination = 'illegal_move'
+                break
+            board.push(move)
+
+    game = chess.pgn.Game.from_board(board)
+    game.headers['Event'] = 'Engine match'
+    game.headers['Round'] = str(index + 1)
+    game.headers['White'] = engine_name(white)
+    game.headers['Black'] = engine_name(black)
+    game.headers['Result'] = result
+    game.headers['Termination'] = termination
+    return {
+        'game': index,
+        'white': engine_name(white),
+        'black': engine_name(black),
+        'result': result,
+        'termination': termination,
+        'plies': board.ply(),
+        'seconds': time.time() - start,
+        'moves': [move.uci() for move in board.move_stack],
+        'pgn': str(game),
+    }
+
+def first_score(record):
+    # score of the first engine, which plays white in even games
+    white_score = {'1-0': 1.0, '0-1': 0.0}.get(record['result'], 0.5)
+    return white_score if record['game'] % 2 == 0 else 1.0 - white_score
+
+def elo(score):
+    # infinite for a score of 0 or 1, no finite difference explains it
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+def elo_interval(wins, draws, losses, z=1.96):
+    # elo difference with a normal-approximation confidence interval on the score
+    games = wins + draws + losses
+    if not games:
+        return 0.0, -math.inf, math.inf
+    score = (wins + 0.5 * draws) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    if not variance:
+        # identical results (all wins, all draws, all losses) say nothing about the
+        # spread: take it from the sample with one more win and one more loss
+        variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2
+                    + (1 - score) ** 2 + score ** 2) / (games + 2)
+    margin = z * math.sqrt(variance / games)
+    return elo(score), elo(score - margin), elo(score + margin)
+
+def run(first, second, games=10, workers=None, movetime=None, opening_plies=4, max_plies=300,
+        seed=0, pgn=None, jsonl=None):
+    # yields (record, wins, draws, losses) as games finish, from the first engine's side
+    tasks = [(i, first, second, movetime, opening_plies, max_plies, hash((seed, i)) & 0xFFFFFFFF)
+             if i % 2 == 0 else
+             (i, second, first, movetime, opening_plies, max_plies, hash((seed, i - 1)) & 0xFFFFFFFF)
+             for i in range(games)]  # colours swap every game, pairs share an opening
+    wins = draws = losses = 0
+    with contextlib.ExitStack() as stack:
+        pgn_file = stack.enter_context(open(pgn, 'a')) if pgn else None
+        jsonl_file = stack.enter_context(open(jsonl, 'a')) if jsonl else None
+        pool = stack.enter_context(multiprocessing.Pool(workers or os.cpu_count()))
+        for record in pool.imap_unordered(play_game, tasks):
+            score = first_score(record)
+            wins += score == 1.0
+            draws += score == 0.5
+            losses += score == 0.0
+            if pgn_file:
+                pgn_file.write(record['pgn'] + "\n\n")
+                pgn_file.flush()
+            if jsonl_file:
+                jsonl_file.write(json.dumps({key: value for key, value in record.items() if key != 'pgn'}) + "\n")
+                jsonl_file.flush()
+            yield record, wins, draws, losses
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless engine vs engine matches")
+    parser.add_argument('first', type=parse_engine, nargs='?', default='mcts',
+                        help="engine spec, e.g. mcts:iterations=500,minimax=true or minimax:depth=4")
+    parser.add_argument('second', type=parse_engine, nargs='?', default='minimax')
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=None, help="game processes, defaults to the CPU count")
+    parser.add_argument('--movetime', type=float, default=None, help="seconds per move")
+    parser.add_argument('--opening-plies', type=int, default=4, help="random moves before the engines take over")
+    parser.add_argument('--max-plies', type=int, default=300, help="adjudicate a draw after this many plies")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--pgn', help="append finished games to this PGN file")
+    parser.add_argument('--jsonl', help="append one JSON record per finished game")
+    args = parser.parse_args(argv)
+
+    first, second = engine_name(args.first), engine_name(args.second)
+    print(f"{first} vs {second}, {args.games} games", file=sys.stderr)
+    wins = draws = losses = 0
+    diff, low, high = elo_interval(wins, draws, losses)
+    for record, wins, draws, losses in run(args.first, args.second, args.games, args.workers, args.movetime,
+                                           args.opening_plies, args.max_plies, args.seed, args.pgn, args.jsonl):
+        diff, low, high = elo_interval(wins, draws, losses)
+        print(f"game {record['game'] + 1}: {record['result']} ({record['termination']}, {record['plies']} plies)"
+              f"  +{wins} ={draws} -{losses}  elo {diff:+.0f} [{low:+.0f}, {high:+.0f}]", file=sys.stderr)
+
+    print(json.dumps({
+        'first': first, 'second': second,
+        'wins': wins, 'draws': draws, 'losses': losses,
+        # null for an open bound, JSON has no infinity
+        **{key: value if math.isfinite(value) else None
+           for key, value in (('elo', diff), ('elo_low', low), ('elo_high', high))},
+    }, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
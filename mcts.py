@@ -1,103 +1,247 @@
 import random
+import time
  
-from node import Node
-from evaluation import *
+from tree import Tree, ROOT, NO_NODE, WIN, DRAW, LOSS
+from timecontrol import TimeManager, SearchTimeout
+from playout import Playout
 
 class MCTS:
-    def __init__(self, tt, mm, minimax=False):
+    def __init__(self, tt, mm, minimax=False, C=2, fpu=float('inf'), playout=None, book=None, stats=None,
+                 widening=None, widening_exponent=0.5, cache=None, tablebase=None, progress=None):
         self.tt = tt
         self.mm = mm
         self.minimax = False
+        self.C = C  # exploration constant
+        self.fpu = fpu  # first play urgency, score of unvisited children
+        # progressive widening: at most widening * visits ** widening_exponent children,
+        # None expands every move of a node before going deeper
+        self.widening = widening
+        self.widening_exponent = widening_exponent
+        self.playout = playout or Playout()
+        self.book = book  # OpeningBook consulted before searching
+        self.tablebase = tablebase  # Tablebase for exact endgame results, optional
+        self.stats = stats  # SearchStats, None when tracing is off
+        self.name = 'mcts'  # how searches are labelled in stats
+        # PositionCache for move generation, give mm the same one so its
+        # searches in simulate share it
+        self.cache = cache
+        self.progress = progress  # called with (best move, depth, nodes) while searching, optional
+        self.clock = TimeManager()
+        self.root = None  # tree kept from the previous move
 
-    def select_leaf(self, node: Node):
+    def select_leaf(self, tree: Tree):
         # traverse the tree in terms of
-        # highest UCT score
-        while node.children:
-            node = max(node.children, key=lambda x: x.uct_score())
+        # highest UCT score, replaying the moves on the tree's board,
+        # until a node that can take another child; solved children are skipped
+        node = ROOT
+        while tree.has_moves(node) and not self.can_expand(tree, node) and tree.num_children[node]:
+            node = tree.best_child(node, self.C, self.fpu)
+            tree.board.push(tree.get_move(node))
         return node
 
-    def expand(self, node: Node):
-        # Check for terminal state
-        if node.state.is_game_over():
-            return node
-    
-        # iterate through all the legal moves
-        moves = list(node.state.legal_moves)
-        if not moves:  # No legal moves, it's a terminal state
+    def can_expand(self, tree: Tree, node):
+        if not tree.untried(node):
+            return False
+        if self.widening is None:
+            return True
+        if all(tree.solved(child) for child in tree.children(node)):
+            return True  # widen past children that are already solved
+        limit = self.widening * max(int(tree.visits[node]), 1) ** self.widening_exponent
+        return tree.num_children[node] < max(limit, 1)
+
+    def expand(self, tree: Tree, node):
+        # moves are generated on the second visit of a node, then one
+        # untried move becomes a child per visit
+        board = tree.board
+        if not tree.has_moves(node):
+            if self.solve_terminal(tree, node):
+                return node
+            moves = list(board.legal_moves if self.cache is None else self.cache.legal_moves(board))
+            random.shuffle(moves)  # untried moves are taken in random order
+            tree.add_moves(node, moves)
+
+        if not tree.untried(node):
             return node
-        
-        for move in moves:
-            # if move not in [c.state for c in node.children]:
-            node.add_child(move)
-        
-        return random.choice(node.children)
-
-    def simulate(self, node: Node):
-        def evaluate(state, current_player):
-            current = state.turn == current_player
-            if state.is_checkmate():
-                return 1000 if current else -1000
-            else:
-                player_colour = 'white' if current else 'black'
-                return evaluate_board(state, player_colour)
-    
+        child = tree.expand_next(node)
+        board.push(tree.get_move(child))
+        self.solve_terminal(tree, child)  # a mate is proven as soon as it is in the tree
+        return child
+
+    def solve_terminal(self, tree: Tree, node):
+        # True if the game is over at node (on the tree's board), which is then proven
+        board = tree.board
+        if not (board.is_game_over() if self.cache is None else self.cache.is_terminal(board)):
+            return False
+        tree.add_moves(node, [])  # terminal, never generated again
+        tree.prove(node, WIN if board.is_checkmate() else DRAW)  # the side to move is mated
+        return True
+
+    def simulate(self, board):
+        # plays out on the given board, callers pass a board they can throw away
+        if self.tablebase is not None:
+            reward = self.tablebase.reward(board)
+            if reward is not None:
+                return reward  # exact, no rollout needed
         if self.minimax:
-            move, min_eval = self.mm.predict_iddfs(node, max_depth=1)
+            move, min_eval = self.mm.predict_iddfs(board, max_depth=1, clock=self.clock)
             if min_eval is not None:
                 return min_eval
 
-        curr_state = node.state.copy()
-        while not is_terminal(curr_state) and curr_state.ply() < 50:
-            legal_moves = list(curr_state.legal_moves)
-            move = random.choice(legal_moves)
-            curr_state.push(move)
-    
         # return state.result()  # 1 for win, 0 for loss, 0.5 for draw
-        return evaluate(curr_state, node.state.turn)
+        return self.playout.run(board, self.clock)
     
-    def backpropagate(self, node: Node, reward: int):
-        while node is not None:
-            node.update(reward)
-            node = node.parent
-
-    def execute_best(self, node: Node):
-        best_child = max(node.children, key=lambda x: (x.wins / x.visits, x.visits))  # Prioritize win ratio, then visits
-        return best_child.move
-
-    def execute_best_minimax(self, node: Node):
-        best_child = max(node.children, key=lambda x: (x.wins / x.visits, x.visits))  # Prioritize win ratio, then visits
-        minimax_move, min_eval = self.mm.predict_iddfs(node, max_depth=3, choices=best_child.parent.children)
-        for child in best_child.parent.children:
-            if child.move == minimax_move:
-                minimax_child = child
-                break
+    def known_move(self, board):
+        # book or tablebase move for the root, no search needed
+        if self.book is not None:
+            entry = self.book.probe(board)
+            if entry is not None:
+                print(f"Book move: {entry.move}")
+                return entry.move
+        if self.tablebase is not None:
+            result = self.tablebase.best_move(board)
+            if result is not None:
+                print(f"Tablebase move: {result[0]}")
+                return result[0]
+        return None
+
+    def backpropagate(self, tree: Tree, node, reward: int):
+        tree.update(node, reward)
+
+    def execute_best(self, tree: Tree):
+        visited = [child for child in tree.children(ROOT) if tree.visits[child]]
+        if not visited:
+            # stopped before anything was searched, any legal move will do
+            return next(iter(tree.board.legal_moves), None)
+        best_child = max(visited, key=lambda x: (tree.value(x), tree.visits[x]))  # Prioritize win ratio, then visits
+        return tree.get_move(best_child)
 
-        # minimax move already exists
-        if minimax_child:
-            self.backpropagate(minimax_child, min_eval)
-            best = max(best_child, minimax_child, key=lambda x: (x.wins / x.visits, x.visits))
-            print(f"Best move: {best.move}")
-            return best.move
-        
-        # Minimax move not in tree, return best child and add it to tree
-        minimax_child = node.parent.add_child(minimax_child)
-        self.backpropagate(minimax_child, min_eval)
-        print(f"best move: {minimax_move}")
-        return minimax_move
+    def execute_most_visited(self, tree: Tree):
+        if not tree.num_children[ROOT]:
+            return next(iter(tree.board.legal_moves), None)
+        visits, wins, proven = tree.visits, tree.wins, tree.proven
+        # proven wins first and proven losses last, then the most visited
+        best_child = max(tree.children(ROOT), key=lambda x: (proven[x] == WIN, proven[x] != LOSS, visits[x],
+                                                             wins[x] / visits[x] if visits[x] else 0))
+        return tree.get_move(best_child)
+
+    def execute_best_minimax(self, tree: Tree):
+        visited = [child for child in tree.children(ROOT) if tree.visits[child]]
+        if not visited:
+            return self.execute_best(tree)
+        best_child = max(visited, key=lambda x: (tree.value(x), tree.visits[x]))  # Prioritize win ratio, then visits
+        choices = [tree.get_move(child) for child in tree.children(ROOT)]
+        minimax_move, min_eval = self.mm.predict_iddfs(tree.board, max_depth=3, choices=choices)
+        minimax_child = tree.find_child(ROOT, minimax_move)
+        if minimax_child == NO_NODE:
+            return tree.get_move(best_child)
+
+        # min_eval is from our side, the child's side to move is the opponent
+        self.backpropagate(tree, minimax_child, -min_eval)
+        best = max(best_child, minimax_child, key=lambda x: (tree.value(x), tree.visits[x]))
+        print(f"Best move: {tree.get_move(best)}")
+        return tree.get_move(best)
     
-    def predict(self, root: Node, iterations=100, minimax=False):
+    def advance_root(self, board):
+        # walk the moves played since the last search down the old tree,
+        # the matching subtree is copied out as the new root and the rest is dropped
+        tree = self.root
+        if tree is not None:
+            played, searched = board.move_stack, tree.board.move_stack
+            node = ROOT if played[:len(searched)] == searched else NO_NODE
+            for move in played[len(searched):]:
+                if node == NO_NODE:
+                    break
+                node = tree.find_child(node, move)
+            if node == NO_NODE:
+                tree = None
+            elif node != ROOT:
+                tree = tree.subtree(node)
+        if tree is None or tree.board.fen() != board.fen():
+            tree = Tree(board)
+        self.root = tree
+        return tree
+
+    def predict(self, root: Tree, iterations=100, minimax=False, limits=None, clock=None):
         self.minimax = minimax
+        self.root = root
+        # a caller can pass its own clock to stop the search from another thread
+        self.clock = clock or TimeManager(limits, root.board.turn)
+        if self.clock.nodes is not None:
+            iterations = min(iterations, self.clock.nodes)
+            self.clock.nodes = None  # counted as iterations here, not minimax nodes
+
+        move = self.known_move(root.board)
+        if move is not None:
+            return move
 
         print("AI thinking...")
+        if self.stats is not None:
+            self.stats.begin()
+            visits, playouts = int(root.visits[ROOT]), self.playout.playouts
+        self.search(root, iterations)
+
+        move = self.execute_best(root)
+        if self.stats is not None:
+            self.stats.iterations += int(root.visits[ROOT]) - visits
+            self.stats.playouts += self.playout.playouts - playouts
+            self.stats.end(self.name, move=move and move.uci(), tree_nodes=len(root), solved=bool(root.solved(ROOT)))
+        return move
+
+    def search(self, root: Tree, iterations):
         for i in range(iterations):
-            print(f"Iteration: {i+1}/{iterations}", end='\r')
-            # go to leaf node based on UCT score
-            # add a child node to the leaf node
-            # simulate the game from the child node
-            # backpropagate the reward from the child node to the root
-            leaf = self.select_leaf(root) # selection
-            child = self.expand(leaf) # expansion
-            reward = self.simulate(child) # simulation
-            self.backpropagate(child, reward) # backpropagation
-        
-        return self.execute_best(root)
\ No newline at end of file
+            if self.clock.expired() or root.solved(ROOT):
+                break  # out of time, or the result is already proven
+            if i % 100 == 99:
+                print(f"Iteration: {i+1}/{iterations}", end='\r')
+                if self.progress is not None:
+                    self.report(root)
+            try:
+                self.iterate(root)
+            except SearchTimeout:
+                break  # the unfinished iteration is dropped, the tree is untouched
+
+    def report(self, tree: Tree):
+        # most visited root move, length of the most visited line and root visits
+        if not tree.num_children[ROOT]:
+            return
+        visits = tree.visits
+        best = max(tree.children(ROOT), key=lambda x: visits[x])
+        depth, node = 1, best
+        while tree.num_children[node]:
+            node = max(tree.children(node), key=lambda x: visits[x])
+            if not visits[node]:
+                break
+            depth += 1
+        self.progress(tree.get_move(best), depth, int(visits[ROOT]))
+
+    def iterate(self, tree: Tree):
+        # go to leaf node based on UCT score
+        # add a child node to the leaf node
+        # simulate the game from the child node
+        # backpropagate the reward from the child node to the root
+        if self.stats is not None:
+            return self.iterate_traced(tree)
+        try:
+            leaf = self.select_leaf(tree) # selection
+            child = self.expand(tree, leaf) # expansion
+            reward = self.simulate(tree.board) # simulation
+            self.backpropagate(tree, child, reward) # backpropagation
+        finally:
+            tree.reset_board()
+
+    def iterate_traced(self, tree: Tree):
+        # same as iterate, timing every phase
+        clock = time.perf_counter
+        add = self.stats.add_phase
+        try:
+            start = clock()
+            leaf = self.select_leaf(tree)
+            now = clock(); add('select', now - start); start = now
+            child = self.expand(tree, leaf)
+            now = clock(); add('expand', now - start); start = now
+            reward = self.simulate(tree.board)
+            now = clock(); add('simulate', now - start); start = now
+            self.backpropagate(tree, child, reward)
+            add('backprop', clock() - start)
+        finally:
+            tree.reset_board()
@@ -1,113 +1,407 @@
-from evaluation import *
 from quiescencesearch import quiescence_search
 import time
-from node import Node
+from tree import Tree
 
-import multiprocessing.dummy
-from transposition_table import TranspositionTable
+import queue
+import multiprocessing
+
+import chess
+
+from transposition_table import TranspositionTable, SharedTranspositionTable, EXACT, LOWERBOUND, UPPERBOUND
+from evaluation import EvalBoard, MATE_SCORE, is_terminal, search_ply
+from tablebase import TB_WIN
+from timecontrol import TimeManager, SearchTimeout, SharedControl
+from move_ordering import MoveOrderer
+
+INFINITY = MATE_SCORE + 1000
+NULL_MOVE_REDUCTION = 2
+ASPIRATION_WINDOW = 50
+STOP_POLL = 0.01  # seconds between clock checks while waiting for pool workers
+MATE_BOUND = TB_WIN - 1000  # scores beyond this count plies to a mate or tablebase result
+
+def score_to_tt(value, ply):
+    # mate and tablebase scores count plies from the root, the table keeps
+    # them counted from the node so every path to it agrees
+    if value >= MATE_BOUND:
+        return value + ply
+    if value <= -MATE_BOUND:
+        return value - ply
+    return value
+
+def score_from_tt(value, ply):
+    if value >= MATE_BOUND:
+        return value - ply
+    if value <= -MATE_BOUND:
+        return value + ply
+    return value
+
+# per process searcher, created by the pool initializer
+_worker = None
+
+def _init_worker(table, tablebase, control):
+    # table is the parent's shared table, or the size of a private one
+    global _worker
+    tt = table if isinstance(table, SharedTranspositionTable) else TranspositionTable(table)
+    _worker = Minimax(tt, workers=1, tablebase=tablebase)
+    _worker.control = control
+
+def _eval_move(args):
+    board, move, depth, alpha, beta, clock, round = args
+    _worker.nodes = 0
+    _worker.reported = 0
+    _worker.clock = clock
+    _worker.round = round
+    try:
+        score = _worker.eval_sibling(board, move, depth, alpha, beta)
+    except SearchTimeout:
+        score = None
+    return move, score, _worker.nodes
 
 class Minimax:
-    def __init__(self, tt=None):
+    def __init__(self, tt=None, workers=None, parallel_depth=2, tt_size=1 << 18, book=None, stats=None,
+                 cache=None, tablebase=None, progress=None):
         self.tt = tt
         if tt is None:
             self.tt = TranspositionTable()
+        self.workers = workers or 1  # parallel search is opt in, pass os.cpu_count() for every core
+        self.parallel_depth = parallel_depth  # shallower searches are not worth the IPC
+        self.tt_size = tt_size
+        self.pool = None
+        self.pool_control = None  # SharedControl of our pool's rounds
+        self.control = None  # set in pool workers: the parent's SharedControl
+        self.round = 0  # round of the task a pool worker is running
+        self.reported = 0  # nodes of that task already added to the shared total
+        self.nodes = 0
+        self.elapsed = 0.0
+        self.clock = TimeManager()
+        self.root_best = (None, None)  # best root move of the depth in progress
+        self.depth_times = []  # (depth, seconds since the search started) per finished depth
+        self.orderer = MoveOrderer()
+        self.book = book  # OpeningBook consulted before searching
+        self.stats = stats  # SearchStats, None when tracing is off
+        self.cache = cache  # PositionCache for move lists and evaluations, optional
+        self.tablebase = tablebase  # Tablebase for exact endgame results, optional
+        self.progress = progress  # called with (best move, depth, nodes) after each depth, optional
+        self.cutoffs = 0
+
+    def get_pool(self):
+        # processes, not threads, so the searches are not serialized by the GIL
+        if self.pool is None:
+            table = self.tt if isinstance(self.tt, SharedTranspositionTable) else self.tt_size
+            self.pool_control = SharedControl()
+            self.pool = multiprocessing.Pool(self.workers, _init_worker, (table, self.tablebase, self.pool_control))
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def nps(self):
+        return self.nodes / self.elapsed if self.elapsed else 0.0
  
-    def minimax(self, board, depth, alpha, beta, maximising):
-        if depth <= 0 or is_terminal(board):
-            return quiescence_search(board, alpha, beta)
-    
-        if maximising:
-            return self.max_value(board, depth, alpha, beta)
-        else:
-            return self.min_value(board, depth, alpha, beta)
-
-    def max_value(self, board, depth, alpha, beta):
-        entry = self.tt.getEntry(depth, board.fen())
-        if entry: return entry.evaluation
-        
-        best_value = float('-inf')
-        for move in board.legal_moves:
-            board.push(move)
-            value = self.minimax(board, depth-1, alpha, beta, False)
-            best_value = max(best_value, value)
-            if entry: entry.update(board, depth, value, entry)
-            alpha = max(alpha, best_value)
+    def negamax(self, board, depth, alpha, beta, allow_null=True):
+        # scores are always from the side to move's point of view
+        self.nodes += 1
+        if self.nodes & 255 == 0:
+            self.check_clock()
+        tablebase = self.tablebase
+        if tablebase is not None and chess.popcount(board.occupied) <= tablebase.max_pieces:
+            value = tablebase.score(board)
+            if value is not None:
+                return value  # exact, nothing below needs searching
+        cache = self.cache
+        if depth <= 0 or (is_terminal(board) if cache is None else cache.is_terminal(board)):
+            return quiescence_search(board, alpha, beta, self.stats, cache)
+
+        key = board.zobrist_key
+        value, alpha, beta, hash_move = self.probe(key, depth, alpha, beta, search_ply(board))
+        if value is not None: return value
+        alpha_orig = alpha
+        in_check = board.is_check()
+
+        # null move: if passing still fails high, a real move will too
+        if (allow_null and not in_check and depth > NULL_MOVE_REDUCTION
+                and beta < MATE_SCORE - 1000 and self.has_pieces(board)):
+            board.push(chess.Move.null())
+            value = -self.negamax(board, depth - 1 - NULL_MOVE_REDUCTION, -beta, -beta + 1, False)
             board.pop()
-            if beta <= alpha:
-                break
-    
-        return best_value
-    
-    def min_value(self, board, depth, alpha, beta):
-        entry = self.tt.getEntry(depth, board.fen())
-        if entry: return entry.evaluation
+            if value >= beta:
+                return value
 
-        best_value = float('inf')
-        for move in board.legal_moves:
+        best_value = -INFINITY
+        best_move = None
+        ply = board.ply()
+        moves = board.legal_moves if cache is None else cache.legal_moves(board)
+        for i, move in enumerate(self.orderer.order(board, moves, ply, hash_move)):
+            quiet = self.orderer.is_quiet(board, move)
             board.push(move)
-            value = self.minimax(board, depth-1, alpha, beta, True)
-            best_value = min(best_value, value)
-            if entry: entry.update(board, depth, value, entry)
-            beta = min(beta, best_value)
+            if i == 0:
+                value = -self.negamax(board, depth - 1, -beta, -alpha)
+            else:
+                # late quiet moves are searched shallower first
+                reduction = 0
+                if depth >= 3 and i >= 3 and quiet and not in_check and not board.is_check():
+                    reduction = 2 if i >= 8 and depth >= 5 else 1
+                # principal variation search: prove the move is worse with a zero window
+                value = -self.negamax(board, depth - 1 - reduction, -alpha - 1, -alpha)
+                if value > alpha and reduction:
+                    value = -self.negamax(board, depth - 1, -alpha - 1, -alpha)
+                if alpha < value < beta:
+                    value = -self.negamax(board, depth - 1, -beta, -alpha)
             board.pop()
-            if beta <= alpha:
+
+            if value > best_value:
+                best_value = value
+                best_move = move
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                self.cutoffs += 1
+                self.orderer.cutoff(board, move, ply, depth)
                 break
-    
+
+        self.save(key, depth, best_value, alpha_orig, beta, best_move, search_ply(board))
         return best_value
 
-    def eval_move(self, board, move, depth, maximising, alpha=float('-inf'), beta=float('inf')):
+    def check_clock(self):
+        # a pool worker also stops when the parent has cancelled its round, and
+        # checks node limits against the total of every process
+        control = self.control
+        if control is None:
+            self.clock.check(self.nodes)
+            return
+        if control.cancelled(self.round):
+            raise SearchTimeout()
+        total = control.add_nodes(self.nodes - self.reported)
+        self.reported = self.nodes
+        self.clock.check(total)
+
+    def has_pieces(self, board):
+        # no null move with only king and pawns, zugzwang is too likely
+        return bool(board.occupied_co[board.turn] & ~(board.pawns | board.kings))
+
+    def probe(self, key, depth, alpha, beta, ply=0):
+        # returns (value or None, alpha, beta, hash move) after applying a stored bound,
+        # a shallower entry still supplies its best move for ordering
+        entry = self.tt.lookup(key)
+        if entry is None:
+            return None, alpha, beta, None
+        if entry.depth < depth:
+            return None, alpha, beta, entry.move
+        value = score_from_tt(entry.evaluation, ply)
+        if entry.flag == EXACT:
+            return value, alpha, beta, entry.move
+        if entry.flag == LOWERBOUND:
+            alpha = max(alpha, value)
+        elif entry.flag == UPPERBOUND:
+            beta = min(beta, value)
+        if alpha >= beta:
+            return value, alpha, beta, entry.move
+        return None, alpha, beta, entry.move
+
+    def save(self, key, depth, value, alpha, beta, move, ply=0):
+        if value <= alpha:
+            flag = UPPERBOUND
+        elif value >= beta:
+            flag = LOWERBOUND
+        else:
+            flag = EXACT
+        self.tt.store(key, depth, score_to_tt(value, ply), flag, move)
+
+    def eval_move(self, board, move, depth, alpha=-INFINITY, beta=INFINITY):
         board.push(move)
-        eval_score = self.minimax(board, depth, alpha, beta, not maximising)
+        eval_score = -self.negamax(board, depth - 1, -beta, -alpha)
         board.pop()
         return eval_score
 
-    def predict(self, board, depth, legal_moves, maximising=True):
+    def eval_sibling(self, board, move, depth, alpha, beta):
+        # zero window first, full window only if the move might be better
+        score = self.eval_move(board, move, depth, alpha, alpha + 1)
+        if alpha < score < beta:
+            score = self.eval_move(board, move, depth, alpha, beta)
+        return score
+
+    def predict(self, board, depth, legal_moves, alpha=-INFINITY, beta=INFINITY):
         best_move = None
-        best_eval = -float("inf") if maximising else float("inf")
-        
-        with multiprocessing.dummy.Pool(processes=4) as pool:
-            results = [pool.apply_async(self.eval_move, (board.copy(), move, depth, maximising)) 
-                    for move in legal_moves]
-            scores = [r.get() for r in results]
-            
-            for move, score in zip(legal_moves, scores):
-                if maximising:
-                    if score > best_eval:
-                        best_eval = score
-                        best_move = move
-                else:
-                    if score < best_eval:
-                        best_eval = score
-                        best_move = move
-                        
+        best_eval = -INFINITY
+        if not legal_moves:
+            return best_move, best_eval
+        if not isinstance(board, EvalBoard):
+            board = EvalBoard.from_board(board)
+            board.root_ply = len(board.move_stack)
+
+        # young brothers wait: search the eldest move alone to get a bound
+        best_move = legal_moves[0]
+        best_eval = self.eval_move(board, best_move, depth, alpha, beta)
+        self.root_best = (best_move, best_eval)
+        siblings = legal_moves[1:]
+        if best_eval >= beta:
+            return best_move, best_eval
+
+        if self.workers > 1 and depth >= self.parallel_depth and len(siblings) > 1:
+            return self.predict_parallel(board, depth, siblings, best_move, best_eval, alpha, beta)
+
+        for move in siblings:
+            score = self.eval_sibling(board, move, depth, max(alpha, best_eval), beta)
+            if score > best_eval:
+                best_eval = score
+                best_move = move
+                self.root_best = (best_move, best_eval)
+                if best_eval >= beta:
+                    break
+
         return best_move, best_eval
 
+    def predict_parallel(self, board, depth, moves, best_move, best_eval, alpha, beta):
+        # keep one move per worker in flight, each started with the best bound known
+        pool = self.get_pool()
+        control = self.pool_control
+        round = control.next_round()
+        control.set_nodes(self.nodes)
+        finished = queue.Queue()  # results of this round only, stale callbacks land in old queues
+        moves = list(moves)
+        running = 0
+
+        def submit(move):
+            window = (max(alpha, best_eval), beta)
+            pool.apply_async(_eval_move, ((board, move, depth) + window + (self.clock, round),),
+                             callback=finished.put, error_callback=finished.put)
 
-    def predict_iddfs(self, root, max_depth=3, maximising=True, choices=None):
+        while moves and running < self.workers:
+            submit(moves.pop(0))
+            running += 1
+
+        try:
+            while running:
+                try:
+                    result = finished.get(timeout=STOP_POLL)
+                except queue.Empty:
+                    # a stop or limit the workers cannot see on their copy of the clock
+                    if self.clock.expired(control.total_nodes()):
+                        raise SearchTimeout()
+                    continue
+                running -= 1
+                if isinstance(result, BaseException):
+                    raise result
+                move, score, nodes = result
+                self.nodes += nodes
+                if score is None:
+                    # a worker ran out of time, the others will stop on their own
+                    raise SearchTimeout()
+                if score > best_eval:
+                    best_eval = score
+                    best_move = move
+                    self.root_best = (best_move, best_eval)
+                    if best_eval >= beta:
+                        break  # fail high, the outstanding results are not needed
+                if moves and self.clock.expired(control.total_nodes()):
+                    raise SearchTimeout()
+                if moves:
+                    submit(moves.pop(0))
+                    running += 1
+        finally:
+            # tasks still running stop at their next clock check instead of
+            # holding up the workers the next search needs
+            control.next_round()
+
+        return best_move, best_eval
+
+    def aspiration_search(self, board, depth, legal_moves, previous):
+        # narrow window around the last depth's score, widened on failure
+        if previous is None or abs(previous) >= MATE_SCORE - 1000:
+            return self.predict(board, depth, legal_moves)
+        delta = ASPIRATION_WINDOW
+        while True:
+            alpha, beta = max(previous - delta, -INFINITY), min(previous + delta, INFINITY)
+            best_move, best_eval = self.predict(board, depth, legal_moves, alpha, beta)
+            if alpha < best_eval < beta or delta >= INFINITY:
+                return best_move, best_eval
+            delta *= 4
+            if best_eval >= beta and best_move is not None:
+                # search the move that failed high first next time
+                legal_moves.remove(best_move)
+                legal_moves.insert(0, best_move)
+
+    def predict_iddfs(self, root, max_depth=3, maximising=True, choices=None, limits=None, clock=None):
+        # best move for the side to move, the score is from its point of view
+        # (from the opponent's when maximising is False)
         board = root
-        if isinstance(board, Node):
-            board = board.state
+        if isinstance(board, Tree):
+            board = board.board
+        if not isinstance(board, EvalBoard):
+            board = EvalBoard.from_board(board)
+        board.root_ply = len(board.move_stack)  # mate distances count from here, see search_ply
+        self.tt.new_search()
+        self.orderer.new_search()
+        self.nodes = 0
+        # a caller that is itself searching (MCTS) shares its own deadlines
+        if clock is None:
+            clock = TimeManager(limits, board.turn) if limits else TimeManager(soft=5)
+        self.clock = clock
+        self.depth_times = []
+        search_start = time.time()
 
         legal_moves = choices
         if choices is None:
             legal_moves = list(board.legal_moves)
         else:
-            legal_moves = [n.move for n in legal_moves]
+            legal_moves = list(legal_moves)
+
+        if self.book is not None:
+            entry = self.book.probe(board, legal_moves)
+            if entry is not None:
+                self.elapsed = time.time() - search_start
+                return entry.move, entry.score if maximising else -entry.score
+        if self.tablebase is not None:
+            result = self.tablebase.best_move(board)
+            if result is not None and (choices is None or result[0] in legal_moves):
+                self.elapsed = time.time() - search_start
+                move, score = result
+                return move, score if maximising else -score
+
+        self.cutoffs = 0
+        if self.stats is not None:
+            self.stats.begin()
+            probes, hits = self.tt.probes, self.tt.hits
+
+        legal_moves = self.orderer.order(board, legal_moves, board.ply())
     
         best_move, best_eval = None, None
     
-        for current_depth in range(1, max_depth + 1, 2):
-            start_time = time.time()
-            current_best_move, current_best_eval = self.predict(board, current_depth, legal_moves, maximising)
-            elapsed_time = time.time() - start_time
-    
-            #print(f"Best move: {current_best_move}, Time: {elapsed_time} seconds")
+        for current_depth in range(1, max_depth + 1):
+            self.root_best = (None, None)
+            try:
+                current_best_move, current_best_eval = self.aspiration_search(board, current_depth, legal_moves, best_eval)
+            except SearchTimeout:
+                # keep the last finished depth, or whatever the first one found
+                if best_move is None:
+                    best_move, best_eval = self.root_best
+                break
+            self.depth_times.append((current_depth, time.time() - search_start))
     
-            if elapsed_time > 5 or (current_depth > 1 and current_best_move == best_move):
-                break  # Stop searching if time limit is reached or no significant improvement
+            #print(f"Best move: {current_best_move}, Time: {self.clock.elapsed()} seconds")
     
             best_move = current_best_move  # Update the best move for the current depth
             best_eval = current_best_eval
+            if self.progress is not None:
+                self.progress(best_move, current_depth, self.nodes)
+            # the next depth searches this move first, as the eldest brother
+            if best_move is not None:
+                legal_moves.remove(best_move)
+                legal_moves.insert(0, best_move)
+
+            if self.clock.soft_expired():
+                break  # Not enough time left to finish another depth
     
+        self.elapsed = time.time() - search_start
+        if self.stats is not None:
+            self.stats.nodes += self.nodes
+            self.stats.cutoffs += self.cutoffs
+            self.stats.tt_probes += self.tt.probes - probes
+            self.stats.tt_hits += self.tt.hits - hits
+            self.stats.end('minimax', move=best_move and best_move.uci(), score=best_eval,
+                           depth_times=self.depth_times)
+        if best_eval is not None and not maximising:
+            best_eval = -best_eval
         return best_move, best_eval
-    
\ No newline at end of file
@@ -0,0 +1,70 @@
+import chess
+
+HASH_MOVE = 1 << 30
+CAPTURE = 1 << 24
+KILLER = 1 << 20
+HISTORY_LIMIT = KILLER - 1  # history never outranks a killer
+
+def mvv_lva(board, move):
+    # most valuable victim first, cheapest attacker breaks ties
+    victim = board.piece_type_at(move.to_square)
+    if victim is None:
+        if not board.is_en_passant(move):
+            return 0
+        victim = chess.PAWN
+    attacker = board.piece_type_at(move.from_square)
+    return victim * 8 - attacker
+
+def order_captures(board, moves):
+    # quiescence ordering: captures by MVV-LVA, promotions, then the rest
+    def key(move):
+        score = mvv_lva(board, move)
+        if move.promotion:
+            score += move.promotion * 8
+        return score
+    return sorted(moves, key=key, reverse=True)
+
+
+class MoveOrderer:
+    # hash move, captures by MVV-LVA, killers of the ply, then quiet moves by history
+    def __init__(self, killers_per_ply=2):
+        self.killers_per_ply = killers_per_ply
+        self.killers = {}  # ply -> quiet moves that caused a beta cutoff
+        self.history = [[0] * 4096, [0] * 4096]  # [colour][from * 64 + to]
+
+    def new_search(self):
+        # killers belong to the old position, old history only gets a lower weight
+        self.killers = {}
+        for table in self.history:
+            for i, value in enumerate(table):
+                if value:
+                    table[i] = value >> 1
+
+    def score(self, board, move, ply, hash_move=None):
+        if move == hash_move:
+            return HASH_MOVE
+        capture = mvv_lva(board, move)
+        if capture or move.promotion:
+            return CAPTURE + capture + (move.promotion or 0) * 8
+        killers = self.killers.get(ply)
+        if killers and move in killers:
+            return KILLER + self.killers_per_ply - killers.index(move)
+        return self.history[board.turn][move.from_square * 64 + move.to_square]
+
+    def order(self, board, moves, ply=0, hash_move=None):
+        return sorted(moves, key=lambda move: self.score(board, move, ply, hash_move), reverse=True)
+
+    def is_quiet(self, board, move):
+        return not (move.promotion or board.is_capture(move))
+
+    def cutoff(self, board, move, ply, depth):
+        # called with the move not yet pushed when it failed high
+        if not self.is_quiet(board, move):
+            return
+        killers = self.killers.setdefault(ply, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[self.killers_per_ply:]
+        table = self.history[board.turn]
+        index = move.from_square * 64 + move.to_square
+        table[index] = min(table[index] + depth * depth, HISTORY_LIMIT)
@@ -0,0 +1,146 @@
+import os
+import random
+import multiprocessing
+
+from mcts import MCTS
+from minimax import Minimax
+from tree import Tree, ROOT, UNPROVEN
+from transposition_table import TranspositionTable, SharedTranspositionTable
+from timecontrol import SearchTimeout
+
+# per process engine, created by the pool initializer
+_worker = None
+
+def _init_worker(table, C, fpu, playout, widening, widening_exponent, tablebase):
+    # table is the parent's shared table, or the size of a private one
+    global _worker
+    tt = table if isinstance(table, SharedTranspositionTable) else TranspositionTable(table)
+    _worker = MCTS(tt, Minimax(tt, workers=1, tablebase=tablebase), C=C, fpu=fpu, playout=playout,
+                   widening=widening, widening_exponent=widening_exponent, tablebase=tablebase)
+
+def _task_seed(seed, *index):
+    # reproducible seed for a task no matter which process runs it
+    return hash((seed,) + index) & 0xFFFFFFFF
+
+def _search_tree(args):
+    # root parallelization: grow an independent tree, report root statistics
+    board, iterations, minimax, seed, clock = args
+    random.seed(seed)
+    _worker.minimax = minimax
+    _worker.clock = clock
+    tree = Tree(board)
+    for _ in range(iterations):
+        if clock.expired() or tree.solved(ROOT):
+            break
+        try:
+            _worker.iterate(tree)
+        except SearchTimeout:
+            break
+    return [(tree.get_move(child), tree.visits[child], tree.wins[child], tree.proven[child])
+            for child in tree.children(ROOT)]
+
+def _simulate_leaf(args):
+    # leaf parallelization: a single playout from the given position
+    board, minimax, seed, clock = args
+    random.seed(seed)
+    _worker.minimax = minimax
+    _worker.clock = clock
+    try:
+        return _worker.simulate(board)
+    except SearchTimeout:
+        return None
+
+
+class ParallelMCTS(MCTS):
+    def __init__(self, tt, mm, minimax=False, workers=None, mode='root', batch_size=None,
+                 virtual_loss=1, seed=0, tt_size=1 << 16, **kwargs):
+        super().__init__(tt, mm, minimax, **kwargs)
+        self.workers = workers or os.cpu_count() or 1
+        self.mode = mode  # 'root' or 'leaf'
+        self.name = f'mcts-{mode}'
+        self.batch_size = batch_size or self.workers
+        self.virtual_loss = virtual_loss
+        self.seed = seed
+        self.tt_size = tt_size
+        self.searches = 0
+        self.pool = None
+
+    def get_pool(self):
+        # keep the pool alive between moves so process start up is paid once
+        if self.pool is None:
+            table = self.tt if isinstance(self.tt, SharedTranspositionTable) else self.tt_size
+            self.pool = multiprocessing.Pool(self.workers, _init_worker,
+                                             (table, self.C, self.fpu, self.playout,
+                                              self.widening, self.widening_exponent, self.tablebase))
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def search(self, root: Tree, iterations):
+        # worker side counters stay in the workers, stats only see the iterations
+        self.searches += 1
+        if self.mode == 'leaf':
+            self.predict_leaf_parallel(root, iterations)
+        else:
+            self.predict_root_parallel(root, iterations)
+
+    def execute_best(self, tree: Tree):
+        # root mode only merges the root children's statistics from the workers
+        if self.mode == 'leaf':
+            return super().execute_best(tree)
+        return self.execute_most_visited(tree)
+
+    def predict_root_parallel(self, tree: Tree, iterations):
+        # split the iteration budget across independent trees
+        share, extra = divmod(iterations, self.workers)
+        tasks = [(tree.board, share + (i < extra), self.minimax, _task_seed(self.seed, self.searches, i), self.clock)
+                 for i in range(self.workers)]
+        tasks = [task for task in tasks if task[1] > 0]
+
+        # every root move can come back from a worker
+        if not tree.has_moves(ROOT):
+            tree.add_children(ROOT, list(tree.board.legal_moves))
+        tree.expand_all(ROOT)
+        for stats in self.get_pool().imap_unordered(_search_tree, tasks):
+            for move, visits, wins, proven in stats:
+                child = tree.find_child(ROOT, move)
+                if proven != UNPROVEN:
+                    tree.prove(child, int(proven))  # a proof in any worker holds for all
+                tree.visits[child] += visits
+                tree.wins[child] += wins
+                tree.visits[ROOT] += visits
+                tree.wins[ROOT] += wins
+
+    def predict_leaf_parallel(self, tree: Tree, iterations):
+        # select a batch of leaves with virtual loss then run their playouts together
+        pool = self.get_pool()
+        done = 0
+        while done < iterations and not self.clock.expired() and not tree.solved(ROOT):
+            batch = min(self.batch_size, iterations - done)
+            leaves, boards = [], []
+            for _ in range(batch):
+                leaf = self.select_leaf(tree)
+                child = self.expand(tree, leaf)
+                boards.append(tree.board.copy())
+                tree.reset_board()
+                tree.add_virtual_loss(child, self.virtual_loss)
+                leaves.append(child)
+
+            tasks = [(board, self.minimax, _task_seed(self.seed, self.searches, done + i), self.clock)
+                     for i, board in enumerate(boards)]
+            rewards = pool.map(_simulate_leaf, tasks)
+
+            for child, reward in zip(leaves, rewards):
+                tree.remove_virtual_loss(child, self.virtual_loss)
+                if reward is not None:  # None when the playout ran out of time
+                    self.backpropagate(tree, child, reward)
+
+            if (done + batch) // 100 > done // 100:  # every 100 iterations, like MCTS.search
+                print(f"Iteration: {done + batch}/{iterations}", end='\r')
+                if self.progress is not None:
+                    self.report(tree)
+            done += batch
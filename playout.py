@@ -0,0 +1,119 @@
+import random
+import time
+
+import chess
+
+from evaluation import evaluate_board
+
+def score(state, current_player):
+    # reward from current_player's side: the side to move is the one mated
+    if state.is_checkmate():
+        return -1000 if state.turn == current_player else 1000
+    return evaluate_board(state, current_player)
+
+
+class Playout:
+    # light random rollouts: pseudo-legal moves checked one at a time instead of
+    # generating every legal move, no repetition or claimable draw checks, and
+    # the position is scored with evaluate_board after max_plies
+    def __init__(self, max_plies=50, capture_bias=0.0, mast=False, mast_epsilon=0.1):
+        self.max_plies = max_plies
+        self.capture_bias = capture_bias  # chance of playing a capture when one exists
+        self.mast = mast  # move-average sampling: prefer moves that did well before
+        self.mast_epsilon = mast_epsilon
+        self.mast_table = {}  # move -> [total reward, count]
+
+        self.playouts = 0
+        self.plies = 0
+        self.elapsed = 0.0
+
+    def run(self, board, clock=None):
+        # plays out on the given board, callers pass a board they can throw away
+        start = time.perf_counter()
+        turn = board.turn
+        played = []
+        while len(played) < self.max_plies and board.halfmove_clock < 100:
+            if clock is not None:
+                clock.check()
+            move = self.choose(board)
+            if move is None:
+                break  # checkmate or stalemate
+            board.push(move)
+            played.append(move)
+
+        reward = score(board, turn)
+        if self.mast:
+            self.update_mast(played, reward)
+
+        self.playouts += 1
+        self.plies += len(played)
+        self.elapsed += time.perf_counter() - start
+        return reward
+
+    def choose(self, board):
+        moves = list(board.generate_pseudo_legal_moves())
+        if self.capture_bias and random.random() < self.capture_bias:
+            enemy = board.occupied_co[not board.turn]
+            captures = [move for move in moves if chess.BB_SQUARES[move.to_square] & enemy]
+            move = self.pick_legal(board, captures)
+            if move is not None:
+                return move
+        if self.mast and random.random() >= self.mast_epsilon:
+            moves.sort(key=self.mast_value, reverse=True)
+            for move in moves:
+                if not board.is_into_check(move):
+                    return move
+            return None
+        return self.pick_legal(board, moves)
+
+    def pick_legal(self, board, moves):
+        # random pseudo-legal move until one does not leave the king in check
+        while moves:
+            i = random.randrange(len(moves))
+            move = moves[i]
+            if not board.is_into_check(move):
+                return move
+            moves[i] = moves[-1]
+            moves.pop()
+        return None
+
+    def mast_value(self, move):
+        total, count = self.mast_table.get(move, (0.0, 0))
+        return total / count if count else 0.0
+
+    def update_mast(self, played, reward):
+        # moves by the side to move at the start get the reward, the others its negation
+        for i, move in enumerate(played):
+            entry = self.mast_table.setdefault(move, [0.0, 0])
+            entry[0] += reward if i % 2 == 0 else -reward
+            entry[1] += 1
+
+    def playouts_per_second(self):
+        return self.playouts / self.elapsed if self.elapsed else 0.0
+
+    def stats(self):
+        return {
+            'playouts': self.playouts,
+            'plies': self.plies,
+            'elapsed': self.elapsed,
+            'playouts_per_second': self.playouts_per_second(),
+            'plies_per_playout': self.plies / self.playouts if self.playouts else 0.0,
+        }
+
+
+def benchmark(fen=chess.STARTING_FEN, playouts=200, depths=(10, 25, 50, 100)):
+    # playouts per second against rollout depth, to tune max_plies
+    random.seed(0)
+    board = chess.Board(fen)
+    for max_plies in depths:
+        for name, playout in (('random', Playout(max_plies)),
+                              ('capture', Playout(max_plies, capture_bias=0.5)),
+                              ('mast', Playout(max_plies, mast=True))):
+            for _ in range(playouts):
+                playout.run(board.copy())
+            stats = playout.stats()
+            print(f"max_plies={max_plies:<4} {name:<8} {stats['playouts_per_second']:8.1f} playouts/s"
+                  f" {stats['plies_per_playout']:6.1f} plies/playout")
+
+if __name__ == "__main__":
+    benchmark()
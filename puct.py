@@ -0,0 +1,165 @@
+import time
+
+import numpy as np
+import chess
+
+from mcts import MCTS
+from tree import Tree, ROOT, WIN, DRAW
+from evaluation import PIECE_VALUES, WHITE_PSQT, BLACK_PSQT, BATCH_WEIGHTS, evaluate_batch
+
+# piece type -> material, 0 for "no piece" so a non-capture gains nothing
+MOVE_VALUES = np.array([0] + [PIECE_VALUES[piece_type] for piece_type in chess.PIECE_TYPES[:-1]] + [0],
+                       dtype=np.float32)
+# [colour, piece type, square] -> piece-square value from that colour's side
+MOVE_PSQT = np.zeros((2, 7, 64), dtype=np.float32)
+for piece_type in chess.PIECE_TYPES:
+    MOVE_PSQT[int(chess.WHITE), piece_type] = WHITE_PSQT[piece_type]
+    MOVE_PSQT[int(chess.BLACK), piece_type] = BLACK_PSQT[piece_type]
+
+
+class Evaluator:
+    # value and policy for a batch of positions. evaluate(boards, moves) returns
+    # (values, priors): values in [-1, 1] from each board's side to move, and
+    # for each board an array of move probabilities in the order of its moves.
+    # Boards are standalone copies without move history, never game over.
+    def evaluate(self, boards, moves):
+        raise NotImplementedError
+
+
+class LinearEvaluator(Evaluator):
+    # values from the material + piece-square weights of evaluate_batch squashed
+    # by tanh, priors from a softmax over each move's material and piece-square gain
+    def __init__(self, weights=BATCH_WEIGHTS, scale=400, temperature=100):
+        self.weights = weights
+        self.scale = scale  # centipawns where the value reaches tanh(1)
+        self.temperature = temperature  # centipawns of gain per unit of logit
+
+    def evaluate(self, boards, moves):
+        values = np.tanh(evaluate_batch(boards, self.weights) / self.scale)
+        return values, self.policy(boards, moves)
+
+    def policy(self, boards, moves):
+        # one (colour, piece, promotion, from, to, captured) row per move of the batch
+        rows = []
+        for board, board_moves in zip(boards, moves):
+            turn = int(board.turn)
+            for move in board_moves:
+                captured = board.piece_type_at(move.to_square)
+                if captured is None and board.is_en_passant(move):
+                    captured = chess.PAWN
+                rows.append((turn, board.piece_type_at(move.from_square), move.promotion or 0,
+                             move.from_square, move.to_square, captured or 0))
+        counts = [len(board_moves) for board_moves in moves]
+        if not rows:
+            return [np.zeros(0, dtype=np.float32) for _ in counts]
+
+        colour, piece, promotion, origin, target, captured = np.array(rows, dtype=np.int64).T
+        promoted = np.where(promotion > 0, promotion, piece)
+        gain = (MOVE_VALUES[captured] + MOVE_VALUES[promoted] - MOVE_VALUES[piece]
+                + MOVE_PSQT[colour, promoted, target] - MOVE_PSQT[colour, piece, origin])
+        logits = np.exp((gain - gain.max()) / self.temperature)
+        # normalise per board in one pass
+        owner = np.repeat(np.arange(len(counts)), counts)
+        totals = np.bincount(owner, weights=logits, minlength=len(counts))
+        priors = (logits / totals[owner]).astype(np.float32)
+        return np.split(priors, np.cumsum(counts)[:-1])
+
+
+class PUCT(MCTS):
+    # MCTS with PUCT selection. Leaves are collected batch_size at a time, each
+    # under a virtual loss so the rest of the batch looks elsewhere, then valued
+    # and given move priors by a single evaluator call. Rewards are in [-1, 1].
+    def __init__(self, tt, mm, evaluator=None, batch_size=16, c_puct=1.5, fpu=0.0, virtual_loss=1, **kwargs):
+        super().__init__(tt, mm, fpu=fpu, **kwargs)
+        self.evaluator = evaluator or LinearEvaluator()
+        self.batch_size = batch_size
+        self.c_puct = c_puct  # exploration constant, scales the priors
+        self.virtual_loss = virtual_loss
+        self.evaluations = 0  # positions sent to the evaluator
+        self.batches = 0
+
+    def select_leaf(self, tree: Tree):
+        # every child of an expanded node exists already, unvisited ones have a prior
+        node = ROOT
+        while tree.num_children[node]:
+            node = tree.best_puct_child(node, self.c_puct, self.fpu)
+            tree.board.push(tree.get_move(node))
+        return node
+
+    def terminal_value(self, board):
+        # value of a finished game for the side to move, None while it goes on
+        if self.cache is not None:
+            if not self.cache.is_terminal(board):
+                return None
+        elif not board.is_game_over():
+            return None
+        return -1.0 if board.is_checkmate() else 0.0
+
+    def search(self, root: Tree, iterations):
+        done = 0
+        while done < iterations and not self.clock.expired() and not root.solved(ROOT):
+            visited = self.iterate_batch(root, min(self.batch_size, iterations - done))
+            if (done + visited) // 100 > done // 100:  # every 100 iterations, like MCTS.search
+                print(f"Iteration: {done + visited}/{iterations}", end='\r')
+                if self.progress is not None:
+                    self.report(root)
+            done += visited
+
+    def iterate_batch(self, tree: Tree, size):
+        # select up to size leaves, evaluate them together, back up the values;
+        # returns the number of leaves visited
+        traced = self.stats is not None
+        start = time.perf_counter() if traced else 0
+        board = tree.board
+        pending = []  # (leaf, standalone board, legal moves, exact value or None)
+        visited = 0
+        while visited < size and not tree.solved(ROOT):
+            try:
+                leaf = self.select_leaf(tree)
+                if tree.has_moves(leaf):
+                    # a finished game found earlier, its result is known without the evaluator
+                    tree.update(leaf, self.terminal_value(board) or 0.0)
+                    visited += 1
+                    continue
+                if any(leaf == node for node, _, _, _ in pending):
+                    break  # the virtual loss no longer steers away, evaluate what we have
+                value = self.terminal_value(board)
+                if value is not None:
+                    tree.add_moves(leaf, [])  # never expanded
+                    tree.prove(leaf, WIN if value < 0 else DRAW)
+                    tree.update(leaf, value)
+                    visited += 1
+                    continue
+                exact = self.tablebase.reward(board, win=1.0) if self.tablebase is not None else None
+                moves = list(board.legal_moves if self.cache is None else self.cache.legal_moves(board))
+                pending.append((leaf, board.copy(stack=False), moves, exact))
+                tree.add_virtual_loss(leaf, self.virtual_loss)
+                visited += 1
+            finally:
+                tree.reset_board()
+        if traced:
+            now = time.perf_counter()
+            self.stats.add_phase('select', now - start)
+            start = now
+        if not pending:
+            return visited
+
+        values, priors = self.evaluator.evaluate([entry[1] for entry in pending], [entry[2] for entry in pending])
+        self.evaluations += len(pending)
+        self.batches += 1
+        if traced:
+            now = time.perf_counter()
+            self.stats.add_phase('simulate', now - start)
+            start = now
+
+        for (leaf, _, moves, exact), value, prior in zip(pending, values, priors):
+            tree.remove_virtual_loss(leaf, self.virtual_loss)
+            tree.add_children(leaf, moves, prior)
+            tree.update(leaf, float(value) if exact is None else exact)
+        if traced:
+            self.stats.add_phase('backprop', time.perf_counter() - start)
+        return visited
+
+    def execute_best(self, tree: Tree):
+        # the most visited root move, which PUCT concentrates on the best one
+        return self.execute_most_visited(tree)
@@ -1,15 +1,21 @@
+import chess
+
 from evaluation import evaluate
+from move_ordering import order_captures
 
-def quiescence_search(board, alpha, beta):
-    stand_pat = evaluate(board)
+def quiescence_search(board, alpha, beta, stats=None, cache=None):
+    if stats is not None:
+        stats.qnodes += 1
+    stand_pat = evaluate(board) if cache is None else cache.evaluate(board)
     if stand_pat >= beta:
         return beta # beta cutoff
     if stand_pat > alpha:
         alpha = stand_pat
         
-    for move in get_captures_and_promotions(board):
+    moves = get_captures_and_promotions(board) if cache is None else cache.captures(board)
+    for move in moves:
         board.push(move)  
-        score = -quiescence_search(board, -beta, -alpha)
+        score = -quiescence_search(board, -beta, -alpha, stats, cache)
         board.pop()
         
         if score >= beta:
@@ -20,9 +26,8 @@ def quiescence_search(board, alpha, beta):
     return alpha
 
 def get_captures_and_promotions(board):
-    moves = []
-    for move in board.legal_moves:
-        if board.is_capture(move) or board.gives_check(move): 
-            moves.append(move)
-            
-    return moves
\ No newline at end of file
+    # generated directly rather than by filtering every legal move
+    moves = list(board.generate_legal_captures())
+    back_rank = chess.BB_RANK_8 if board.turn == chess.WHITE else chess.BB_RANK_1
+    moves.extend(board.generate_legal_moves(board.pawns, back_rank & ~board.occupied))
+    return order_captures(board, moves)
\ No newline at end of file
@@ -0,0 +1,66 @@
+import json
+import time
+
+COUNTERS = ('nodes', 'qnodes', 'cutoffs', 'tt_probes', 'tt_hits', 'playouts', 'iterations')
+PHASES = ('select', 'expand', 'simulate', 'backprop')  # MCTS iteration phases
+
+class SearchStats:
+    # counters and per-phase timers shared by the engines that are given it;
+    # engines hold None instead when tracing is off, so the hot loops only pay
+    # for an "is not None" test. Hot counters (nodes, cutoffs, TT probes,
+    # playouts) are kept by the engines anyway and are added here per search.
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        for name in COUNTERS:
+            setattr(self, name, 0)
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.searches = []  # one record per top level search
+        self.active = 0
+        self.snapshot = None
+
+    def counters(self):
+        return {name: getattr(self, name) for name in COUNTERS}
+
+    def begin(self):
+        # nested searches (minimax inside an MCTS simulation) fold into the outer one
+        if self.active == 0:
+            self.snapshot = (self.counters(), dict(self.phases), time.perf_counter())
+        self.active += 1
+
+    def end(self, engine, **fields):
+        self.active -= 1
+        if self.active:
+            return
+        counters, phases, start = self.snapshot
+        record = {'engine': engine, 'seconds': time.perf_counter() - start}
+        record.update({name: value - counters[name] for name, value in self.counters().items()})
+        record['phases'] = {name: self.phases[name] - phases[name] for name in PHASES if self.phases[name] - phases[name]}
+        record.update(fields)
+        self.searches.append(record)
+
+    def add_phase(self, phase, seconds):
+        self.phases[phase] += seconds
+
+    def tt_hit_rate(self):
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    def as_dict(self):
+        totals = self.counters()
+        totals['tt_hit_rate'] = self.tt_hit_rate()
+        totals['phases'] = dict(self.phases)
+        return {'totals': totals, 'searches': self.searches}
+
+    def export(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+    def report(self):
+        lines = [f"{name:>10}: {getattr(self, name)}" for name in COUNTERS]
+        lines.append(f"{'tt hits':>10}: {self.tt_hit_rate():.1%}")
+        total = sum(self.phases.values())
+        for name in PHASES:
+            if self.phases[name]:
+                lines.append(f"{name:>10}: {self.phases[name]:.3f}s ({self.phases[name] / total:.0%})")
+        return "\n".join(lines)
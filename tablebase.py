@@ -0,0 +1,124 @@
+import chess
+import chess.syzygy
+
+from cache import LRUCache, position_key
+from evaluation import MATE_SCORE, search_ply
+
+TB_WIN = MATE_SCORE - 2000  # below every mate score, above any evaluation
+
+class Tablebase:
+    # optional Syzygy probing from a local directory. Results are exact, so
+    # the searches stop at any position with few enough pieces. Cursed wins and
+    # blessed losses score as draws, and so does a win or loss that the
+    # distance to zeroing (when its table is there) shows cannot be reached
+    # before the halfmove clock runs out.
+    def __init__(self, path, cache_size=1 << 16):
+        self.path = path
+        self.tables = chess.syzygy.open_tablebase(path)
+        # table names look like KRPvKR, the largest one bounds what can be probed
+        self.max_pieces = max((len(name) - 1 for name in self.tables.wdl), default=0)
+        # key -> [raw WDL of the side to move, DTZ or None until needed]; the
+        # key leaves out the halfmove clock, which is applied on the way out
+        self.cache = LRUCache(cache_size)
+        self.missing = set()  # material signatures without a table file
+
+        self.probes = 0
+        self.hits = 0
+        self.misses = 0  # in range but no table for the material
+
+    def __reduce__(self):
+        # open files do not pickle, worker processes open the directory themselves
+        return (Tablebase, (self.path, self.cache.size))
+
+    def close(self):
+        self.tables.close()
+
+    def in_range(self, board):
+        return (chess.popcount(board.occupied) <= self.max_pieces
+                and not board.castling_rights)
+
+    def wdl(self, board):
+        # 2 win, 0 draw, -2 loss for the side to move under the 50 move rule,
+        # None if the position is not covered
+        if not self.in_range(board):
+            return None
+        self.probes += 1
+        key = position_key(board)
+        entry = self.cache.get(key)
+        if entry is None:
+            signature = chess.syzygy.calc_key(board)
+            wdl = None if signature in self.missing else self.tables.get_wdl(board)
+            if wdl is None:
+                self.missing.add(signature)  # never probed again for this material
+                self.misses += 1
+                return None
+            entry = [wdl, None]
+            self.cache.put(key, entry)
+        self.hits += 1
+        wdl = entry[0]
+        if wdl in (1, -1):
+            return 0  # cursed win or blessed loss
+        if wdl and board.halfmove_clock:
+            if entry[1] is None:
+                entry[1] = self.tables.get_dtz(board)
+            if entry[1] is not None and abs(entry[1]) + board.halfmove_clock > 100:
+                return 0  # the clock runs out before the pawn move or capture
+        return wdl
+
+    def score(self, board):
+        # search score for the side to move, nearer wins are better
+        wdl = self.wdl(board)
+        if wdl is None:
+            return None
+        if wdl == 2:
+            return TB_WIN - search_ply(board)
+        if wdl == -2:
+            return -TB_WIN + search_ply(board)
+        return 0
+
+    def reward(self, board, win=1000):
+        # rollout result for the side to move, on the scale of a mate in the playout
+        wdl = self.wdl(board)
+        if wdl is None:
+            return None
+        return win if wdl == 2 else -win if wdl == -2 else 0
+
+    def best_move(self, board):
+        # (move, score) at a covered root using the distance to zeroing tables,
+        # None when the position or its DTZ tables are not available
+        result = self.wdl(board)
+        if result is None:
+            return None
+        best, best_key = None, None
+        for move in board.legal_moves:
+            board.push(move)
+            try:
+                if board.is_checkmate():
+                    return move, TB_WIN
+                wdl = self.tables.get_wdl(board)
+                dtz = self.tables.get_dtz(board)
+            finally:
+                board.pop()
+            if wdl is None or dtz is None:
+                return None
+            # best result first, then the fastest win or the slowest loss
+            key = (-wdl, dtz)
+            if best_key is None or key > best_key:
+                best, best_key = move, key
+        if best is None:
+            return None
+        return best, TB_WIN if result == 2 else -TB_WIN if result == -2 else 0
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def stats(self):
+        return {
+            'max_pieces': self.max_pieces,
+            'probes': self.probes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'missing_tables': sorted(self.missing),
+            'cache': self.cache.stats(),
+            'hit_rate': self.hit_rate(),
+        }
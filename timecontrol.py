@@ -0,0 +1,116 @@
+import multiprocessing
+import time
+
+import chess
+
+class SearchTimeout(Exception):
+    # raised inside a search when the hard deadline or node limit is hit
+    pass
+
+
+class SharedControl:
+    # search round number and node total in shared memory, handed to pool
+    # workers through the pool initializer: every task carries the round it
+    # belongs to and stops at its next clock check once the parent has moved on
+    # to another round, and node limits apply to the nodes of all processes
+    def __init__(self):
+        self.round = multiprocessing.Value('q', 0, lock=False)  # only the parent writes it
+        self.nodes = multiprocessing.Value('q', 0)
+
+    def set_nodes(self, nodes):
+        with self.nodes.get_lock():
+            self.nodes.value = nodes
+
+    def add_nodes(self, count):
+        # returns the new total
+        with self.nodes.get_lock():
+            self.nodes.value += count
+            return self.nodes.value
+
+    def total_nodes(self):
+        return self.nodes.value
+
+    def next_round(self):
+        # cancels whatever is still running and returns the id of the new round
+        self.round.value += 1
+        return self.round.value
+
+    def cancelled(self, round):
+        return self.round.value != round
+
+
+class SearchLimits:
+    # all times in seconds, nodes counts minimax nodes or MCTS iterations
+    def __init__(self, movetime=None, wtime=None, btime=None, winc=0, binc=0, movestogo=None, nodes=None):
+        self.movetime = movetime
+        self.wtime = wtime
+        self.btime = btime
+        self.winc = winc
+        self.binc = binc
+        self.movestogo = movestogo
+        self.nodes = nodes
+
+
+class TimeManager:
+    MOVES_TO_GO = 30  # assumed moves left when the clock has no moves-to-go
+    HARD_FACTOR = 3  # hard deadline as a multiple of the soft one
+    MARGIN = 0.05  # seconds kept back for move transmission
+
+    def __init__(self, limits=None, turn=chess.WHITE, soft=None, hard=None):
+        self.stopped = False
+        self.restart(limits, turn, soft, hard)
+
+    def restart(self, limits=None, turn=chess.WHITE, soft=None, hard=None):
+        # absolute wall clock deadlines, so they can be shipped to other processes;
+        # counted from now, so a ponder search can become the real one mid-way
+        self.start = time.time()
+        self.nodes = limits.nodes if limits else None
+
+        if limits is not None:
+            soft, hard = self.allocate(limits, turn, soft, hard)
+
+        self.soft_deadline = None if soft is None else self.start + soft
+        self.hard_deadline = None if hard is None else self.start + hard
+
+    def allocate(self, limits, turn, soft, hard):
+        if limits.movetime is not None:
+            movetime = max(limits.movetime - self.MARGIN, 0)
+            return movetime, movetime
+
+        remaining = limits.wtime if turn == chess.WHITE else limits.btime
+        if remaining is None:
+            return soft, hard
+        increment = limits.winc if turn == chess.WHITE else limits.binc
+        moves_to_go = limits.movestogo or self.MOVES_TO_GO
+
+        soft = remaining / moves_to_go + increment * 0.75
+        # never plan to use more than half of what is left on the clock
+        hard = min(soft * self.HARD_FACTOR, remaining * 0.5)
+        soft = min(soft, hard)
+        return max(soft - self.MARGIN, 0), max(hard - self.MARGIN, 0)
+
+    def elapsed(self):
+        return time.time() - self.start
+
+    def stop(self):
+        # seen by the searching thread at its next check; pool workers do not
+        # see this object, the parent cancels their round when it notices
+        self.stopped = True
+
+    def soft_expired(self):
+        # checked between iterations: do not start work that will not finish
+        if self.stopped:
+            return True
+        return self.soft_deadline is not None and time.time() >= self.soft_deadline
+
+    def expired(self, nodes=0):
+        # checked inside the search loops
+        if self.stopped:
+            return True
+        if self.nodes is not None and nodes >= self.nodes:
+            return True
+        return self.hard_deadline is not None and time.time() >= self.hard_deadline
+
+    def check(self, nodes=0):
+        if self.expired(nodes):
+            raise SearchTimeout()
@@ -1,31 +1,180 @@
+from multiprocessing import shared_memory
+
+from tree import encode_move, decode_move
+
+EXACT = 0
+LOWERBOUND = 1  # fail high, real value >= evaluation
+UPPERBOUND = 2  # fail low, real value <= evaluation
+
 class TranspositionTable:
-    def __init__(self):
-        self.table = {}
+    def __init__(self, size=1 << 20):
+        # fixed number of slots indexed by the low bits of the zobrist key
+        self.size = size
+        self.table = [None] * size
+        self.age = 0
 
-    def lookup(self, key):
-        return self.table.get(key)
+        self.probes = 0
+        self.hits = 0
+        self.collisions = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def new_search(self):
+        # entries from older searches are the first to be replaced
+        self.age += 1
+
+    def clear(self):
+        self.table = [None] * self.size
+        self.age = 0
 
-    def store(self, entry):
-        self.table[entry.key] = entry
+    def lookup(self, key):
+        self.probes += 1
+        entry = self.table[key % self.size]
+        if entry is None:
+            return None
+        if entry.key != key:
+            self.collisions += 1
+            return None
+        self.hits += 1
+        return entry
 
     def getEntry(self, depth, key):
         entry = self.lookup(key)
         if entry and entry.depth >= depth:
             return entry
         return None
-        
 
-    def update(self, board, depth, value, entry):
-        if value > entry.evaluation:
-            self.store(Entry(
-                key=board.fen(),
-                depth=depth,
-                evaluation=value
-            ))
+    def store(self, key, depth, evaluation, flag=EXACT, move=None):
+        index = key % self.size
+        entry = self.table[index]
+        if entry is not None:
+            if entry.key == key:
+                # keep the deeper result from this search
+                if entry.age == self.age and entry.depth > depth:
+                    return
+                if move is None:
+                    move = entry.move
+            elif entry.age == self.age and entry.depth > depth:
+                # depth-preferred, stale entries are always replaced
+                return
+            self.overwrites += 1
+
+        self.stores += 1
+        self.table[index] = Entry(key, depth, evaluation, flag, move, self.age)
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'probes': self.probes,
+            'hits': self.hits,
+            'collisions': self.collisions,
+            'stores': self.stores,
+            'overwrites': self.overwrites,
+            'hit_rate': self.hit_rate(),
+        }
 
 
 class Entry:
-    def __init__(self, key, depth, evaluation):
+    __slots__ = ('key', 'depth', 'evaluation', 'flag', 'move', 'age')
+
+    def __init__(self, key, depth, evaluation, flag=EXACT, move=None, age=0):
         self.key = key
         self.depth = depth
-        self.evaluation = evaluation
\ No newline at end of file
+        self.evaluation = evaluation
+        self.flag = flag
+        self.move = move
+        self.age = age
+
+
+class SharedTranspositionTable(TranspositionTable):
+    # fixed-size table in shared memory that worker processes attach to by name.
+    # Each slot is two 64-bit words, key ^ data and data, written without locks:
+    # a slot torn by a concurrent store fails the xor check and reads as a miss.
+    # data: evaluation (32 bits, offset) | move (16) | depth (8) | flag (2) | age (6)
+    SLOT_BYTES = 16
+    EVAL_OFFSET = 1 << 31
+
+    def __init__(self, size_mb=16, name=None):
+        create = name is None
+        if create:
+            size = max(size_mb * (1 << 20) // self.SLOT_BYTES, 1)
+            # one extra slot in front holds the search age for every process
+            self.shm = shared_memory.SharedMemory(create=True, size=(size + 1) * self.SLOT_BYTES)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            size = self.shm.size // self.SLOT_BYTES - 1
+        self.owner = create
+        self.size = size
+        self.words = self.shm.buf.cast('Q')
+        if create:
+            self.clear()
+
+        self.probes = 0
+        self.hits = 0
+        self.collisions = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def __reduce__(self):
+        # workers attach to the same memory instead of receiving a copy
+        return (SharedTranspositionTable, (0, self.shm.name))
+
+    @property
+    def age(self):
+        return self.words[0]
+
+    def new_search(self):
+        self.words[0] = (self.words[0] + 1) & 63
+
+    def clear(self):
+        self.shm.buf[:] = bytes(len(self.shm.buf))
+
+    def close(self):
+        self.words.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def lookup(self, key):
+        self.probes += 1
+        index = 2 * (1 + key % self.size)
+        check, data = self.words[index], self.words[index + 1]
+        if not data:
+            return None
+        if check ^ data != key:
+            self.collisions += 1  # another position, or a slot torn by a concurrent store
+            return None
+        self.hits += 1
+        move = data >> 32 & 0xFFFF
+        return Entry(key, data >> 48 & 0xFF, (data & 0xFFFFFFFF) - self.EVAL_OFFSET, data >> 56 & 3,
+                     decode_move(move) if move else None, data >> 58)
+
+    def store(self, key, depth, evaluation, flag=EXACT, move=None):
+        index = 2 * (1 + key % self.size)
+        age = self.words[0]
+        data = self.words[index + 1]
+        if data:
+            stored_depth, stored_age = data >> 48 & 0xFF, data >> 58
+            if self.words[index] ^ data == key:
+                # keep the deeper result from this search
+                if stored_age == age and stored_depth > depth:
+                    return
+                if move is None:
+                    code = data >> 32 & 0xFFFF
+                    move = decode_move(code) if code else None
+            elif stored_age == age and stored_depth > depth:
+                # depth-preferred, stale entries are always replaced
+                return
+            self.overwrites += 1
+
+        self.stores += 1
+        data = ((int(evaluation) + self.EVAL_OFFSET) & 0xFFFFFFFF
+                | (encode_move(move) if move else 0) << 32
+                | min(max(depth, 0), 255) << 48
+                | flag << 56
+                | age << 58)
+        self.words[index] = key ^ data
+        self.words[index + 1] = data
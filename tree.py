@@ -0,0 +1,253 @@
+from math import log
+
+import numpy as np
+import chess
+
+ROOT = 0
+NO_NODE = -1
+
+# proven game results from the side that moved into a node, UNPROVEN until solved
+WIN, DRAW, LOSS = 1, 0, -1
+UNPROVEN = 2
+
+def encode_move(move):
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+def decode_move(code):
+    code = int(code)
+    return chess.Move(code & 63, code >> 6 & 63, code >> 12 or None)
+
+
+class Tree:
+    # struct-of-arrays search tree: node i is the i-th entry of every array,
+    # the children of a node are stored next to each other, and positions
+    # are rebuilt by replaying moves from the root board instead of being stored.
+    # A node's moves are stored as one block when first generated; only the
+    # first num_children entries are expanded children, the rest of the block
+    # (num_moves - num_children) is the node's list of untried moves.
+    def __init__(self, board, capacity=1024):
+        self.board = board.copy()  # always at the root position between iterations
+        self.root_ply = len(self.board.move_stack)
+
+        self.size = 0
+        self.visits = np.zeros(capacity, dtype=np.int32)
+        self.wins = np.zeros(capacity, dtype=np.float64)
+        self.parent = np.full(capacity, NO_NODE, dtype=np.int32)
+        self.first_child = np.full(capacity, NO_NODE, dtype=np.int32)
+        self.num_children = np.zeros(capacity, dtype=np.int32)
+        self.num_moves = np.full(capacity, -1, dtype=np.int32)  # -1 until the moves are generated
+        self.move = np.zeros(capacity, dtype=np.int32)
+        self.prior = np.zeros(capacity, dtype=np.float32)  # policy probability, PUCT only
+        self.proven = np.full(capacity, UNPROVEN, dtype=np.int8)
+        self.allocate(NO_NODE, [0])
+
+    def __len__(self):
+        return self.size
+
+    def reserve(self, size):
+        capacity = len(self.visits)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        self.visits = np.resize(self.visits, capacity)
+        self.wins = np.resize(self.wins, capacity)
+        self.parent = np.resize(self.parent, capacity)
+        self.first_child = np.resize(self.first_child, capacity)
+        self.num_children = np.resize(self.num_children, capacity)
+        self.num_moves = np.resize(self.num_moves, capacity)
+        self.move = np.resize(self.move, capacity)
+        self.prior = np.resize(self.prior, capacity)
+        self.proven = np.resize(self.proven, capacity)
+
+    def allocate(self, parent, moves):
+        # a block of fresh nodes with encoded moves, returns the first index
+        first = self.size
+        end = first + len(moves)
+        self.reserve(end)
+        self.visits[first:end] = 0
+        self.wins[first:end] = 0.0
+        self.parent[first:end] = parent
+        self.first_child[first:end] = NO_NODE
+        self.num_children[first:end] = 0
+        self.num_moves[first:end] = -1
+        self.move[first:end] = moves
+        self.prior[first:end] = 0.0
+        self.proven[first:end] = UNPROVEN
+        self.size = end
+        return first
+
+    def add_moves(self, node, moves):
+        # store the node's moves as untried, children are expanded one at a time
+        first = self.allocate(node, [encode_move(move) for move in moves])
+        self.first_child[node] = first
+        self.num_moves[node] = len(moves)
+        return first
+
+    def add_children(self, node, moves, priors=None):
+        first = self.add_moves(node, moves)
+        self.num_children[node] = len(moves)
+        if priors is not None:
+            self.prior[first:first + len(moves)] = priors
+        return first
+
+    def has_moves(self, node):
+        return self.num_moves[node] >= 0
+
+    def untried(self, node):
+        return int(self.num_moves[node] - self.num_children[node])
+
+    def expand_next(self, node):
+        # turn the next untried move into a child
+        child = int(self.first_child[node] + self.num_children[node])
+        self.num_children[node] += 1
+        return child
+
+    def expand_all(self, node):
+        self.num_children[node] = self.num_moves[node]
+
+    def children(self, node):
+        first = int(self.first_child[node])
+        return range(first, first + int(self.num_children[node]))
+
+    def get_move(self, node):
+        return decode_move(self.move[node])
+
+    def find_child(self, node, move):
+        first = int(self.first_child[node])
+        matches = np.flatnonzero(self.move[first:first + self.num_children[node]] == encode_move(move))
+        return first + int(matches[0]) if len(matches) else NO_NODE
+
+    def ancestors(self, node):
+        # node and every node above it up to the root
+        path = []
+        while node != NO_NODE:
+            path.append(node)
+            node = int(self.parent[node])
+        return path
+
+    def prove(self, node, result):
+        # MCTS-Solver: result (WIN, DRAW or LOSS for the side that moved into
+        # node) is exact, so each parent is solved as soon as one child wins for
+        # it, or every move has been expanded and solved
+        self.proven[node] = result
+        node = int(self.parent[node])
+        while node != NO_NODE:
+            first = int(self.first_child[node])
+            children = self.proven[first:first + int(self.num_children[node])]
+            if (children == WIN).any():
+                result = LOSS
+            elif self.untried(node) or (children == UNPROVEN).any():
+                return
+            else:
+                result = -int(children.max())  # the best of drawn and lost moves
+            self.proven[node] = result
+            node = int(self.parent[node])
+
+    def solved(self, node):
+        return self.proven[node] != UNPROVEN
+
+    def value(self, node):
+        # average reward from the side that moved into node, exact once proven
+        proof = self.proven[node]
+        if proof == WIN:
+            return float('inf')
+        if proof == LOSS:
+            return float('-inf')
+        if proof == DRAW:
+            return 0.0
+        return float(self.wins[node]) / max(int(self.visits[node]), 1)
+
+    def add_virtual_loss(self, node, amount=1):
+        # make the path look worse so the rest of a batch explores elsewhere
+        path = self.ancestors(node)
+        self.visits[path] += 1
+        self.wins[path] -= amount
+
+    def remove_virtual_loss(self, node, amount=1):
+        path = self.ancestors(node)
+        self.visits[path] -= 1
+        self.wins[path] += amount
+
+    def update(self, node, result):
+        # result is from the side to move at node; every node keeps its value
+        # from the side that moved into it, so the sign flips at each level
+        path = self.ancestors(node)
+        self.visits[path] += 1
+        signs = np.ones(len(path))
+        signs[::2] = -1
+        self.wins[path] += signs * result
+
+    def uct_scores(self, node, C=2, fpu=float('inf')):
+        # UCT of every child at once, unvisited children get the first play urgency
+        first = int(self.first_child[node])
+        end = first + int(self.num_children[node])
+        visits = self.visits[first:end]
+        safe_visits = np.maximum(visits, 1)
+        scores = self.wins[first:end] / safe_visits
+        scores += np.sqrt(C * log(max(int(self.visits[node]), 1)) / safe_visits)
+        if not visits.all():
+            scores[visits == 0] = fpu
+        proven = self.proven[first:end] != UNPROVEN
+        if proven.any():
+            scores[proven] = -np.inf  # solved, nothing left to learn there
+        return scores
+
+    def best_child(self, node, C=2, fpu=float('inf')):
+        return int(self.first_child[node]) + int(np.argmax(self.uct_scores(node, C, fpu)))
+
+    def puct_scores(self, node, c_puct=1.5, fpu=0.0):
+        # Q + U of every child at once: U = c * prior * sqrt(N) / (1 + n),
+        # unvisited children take fpu as their value
+        first = int(self.first_child[node])
+        end = first + int(self.num_children[node])
+        visits = self.visits[first:end]
+        q = np.where(visits > 0, self.wins[first:end] / np.maximum(visits, 1), fpu)
+        scores = q + c_puct * self.prior[first:end] * (np.sqrt(max(int(self.visits[node]), 1)) / (1 + visits))
+        return np.where(self.proven[first:end] != UNPROVEN, -np.inf, scores)
+
+    def best_puct_child(self, node, c_puct=1.5, fpu=0.0):
+        return int(self.first_child[node]) + int(np.argmax(self.puct_scores(node, c_puct, fpu)))
+
+    def path(self, node):
+        moves = [self.get_move(n) for n in self.ancestors(node)[:-1]]
+        moves.reverse()
+        return moves
+
+    def state(self, node):
+        # standalone board for a node, replayed from the root
+        board = self.board.copy()
+        for move in self.path(node):
+            board.push(move)
+        return board
+
+    def reset_board(self):
+        # undo whatever an iteration pushed onto the shared board
+        while len(self.board.move_stack) > self.root_ply:
+            self.board.pop()
+
+    def subtree(self, node):
+        # compact copy of the subtree under node, with node as the new root
+        tree = Tree(self.state(node))
+        tree.visits[ROOT] = self.visits[node]
+        tree.wins[ROOT] = self.wins[node]
+        tree.proven[ROOT] = self.proven[node]
+        pending = [(node, ROOT)]
+        for old, new in pending:
+            size = int(self.num_moves[old])
+            if size < 0:
+                continue
+            # the whole block moves, untried moves included
+            start = int(self.first_child[old])
+            block = slice(start, start + size)
+            first = tree.allocate(new, self.move[block])
+            count = int(self.num_children[old])
+            tree.first_child[new] = first
+            tree.num_children[new] = count
+            tree.num_moves[new] = size
+            tree.visits[first:first + size] = self.visits[block]
+            tree.wins[first:first + size] = self.wins[block]
+            tree.prior[first:first + size] = self.prior[block]
+            tree.proven[first:first + size] = self.proven[block]
+            pending.extend(zip(range(start, start + count), range(first, first + count)))
+        return tree
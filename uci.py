@@ -0,0 +1,337 @@
+import asyncio
+import concurrent.futures
+import sys
+
+import chess
+
+import mcts, minimax, puct
+from tree import ROOT, NO_NODE
+from timecontrol import SearchLimits, TimeManager
+from transposition_table import TranspositionTable
+from cache import PositionCache
+from tablebase import Tablebase
+from zobrist import zobrist_hash
+from evaluation import MATE_SCORE
+
+NAME = "Chess-AI"
+MAX_DEPTH = 64  # depth bound for searches that only stop on time
+MAX_ITERATIONS = 10 ** 9
+
+# name -> (uci type, default, extra declaration)
+OPTIONS = {
+    'Engine': ('combo', 'minimax', 'var minimax var mcts var puct'),
+    'Depth': ('spin', 4, 'min 1 max 64'),
+    'Iterations': ('spin', 1000, 'min 1 max 1000000'),
+    'Ponder': ('check', False, ''),
+    'SyzygyPath': ('string', '<empty>', ''),
+}
+
+def format_score(score):
+    # "cp N", or "mate N" in moves (negative when we are mated) for mate scores
+    if abs(score) > MATE_SCORE - 1000:
+        moves = (MATE_SCORE - abs(score) + 1) // 2
+        return f"mate {moves if score > 0 else -moves}"
+    return f"cp {score}"
+
+def parse_go(tokens):
+    # -> (SearchLimits, depth, infinite, ponder), UCI times are in milliseconds
+    limits = SearchLimits()
+    depth = None
+    infinite = ponder = False
+    timed = False
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        value = tokens[i + 1] if i + 1 < len(tokens) else None
+        if token in ('wtime', 'btime', 'winc', 'binc', 'movetime'):
+            setattr(limits, token, int(value) / 1000)
+            timed = timed or token != 'winc' and token != 'binc'
+            i += 1
+        elif token == 'movestogo':
+            limits.movestogo = int(value)
+            i += 1
+        elif token == 'nodes':
+            limits.nodes = int(value)
+            i += 1
+        elif token == 'depth':
+            depth = int(value)
+            i += 1
+        elif token == 'infinite':
+            infinite = True
+        elif token == 'ponder':
+            ponder = True
+        i += 1
+    if not timed and limits.nodes is None:
+        limits = None
+    return limits, depth, infinite, ponder
+
+
+class UCIEngine:
+    # stdin commands are read on the event loop, the search runs in one worker
+    # thread and is stopped through its TimeManager, so isready/stop are
+    # answered while the engine is thinking
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.options = {name: default for name, (_, default, _) in OPTIONS.items()}
+        self.board = chess.Board()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.search_task = None
+        self.clock = None
+        self.release = None  # set when a ponder/infinite search may report its move
+        self.ponder_limits = None
+        self.tablebase = None
+        self.new_engines()
+
+    def new_engines(self):
+        self.tt = TranspositionTable()
+        self.cache = PositionCache()
+        self.mm = minimax.Minimax(self.tt, workers=1, cache=self.cache, tablebase=self.tablebase)
+        self.mcts = mcts.MCTS(self.tt, self.mm, cache=self.cache, tablebase=self.tablebase)
+        self.puct = puct.PUCT(self.tt, self.mm, cache=self.cache, tablebase=self.tablebase)
+
+    def send(self, line):
+        self.output.write(line + "\n")
+        self.output.flush()
+
+    async def run(self, input=sys.stdin):
+        loop = asyncio.get_running_loop()
+        while True:
+            line = await loop.run_in_executor(None, input.readline)
+            if not line:
+                break  # the GUI closed the pipe
+            if not await self.handle(line.split()):
+                break
+        await self.stop()
+        self.executor.shutdown()
+
+    async def handle(self, tokens):
+        # returns False on quit
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == 'uci':
+            self.send(f"id name {NAME}")
+            self.send("id author Chess-AI authors")
+            for name, (kind, default, extra) in OPTIONS.items():
+                default = str(default).lower() if kind == 'check' else default
+                self.send(f"option name {name} type {kind} default {default} {extra}".rstrip())
+            self.send("uciok")
+        elif command == 'isready':
+            self.send("readyok")
+        elif command == 'setoption':
+            try:
+                self.set_option(args)
+            except (ValueError, TypeError) as error:
+                self.send(f"info string ignored setoption: {error}")
+        elif command == 'ucinewgame':
+            await self.stop()
+            self.new_engines()
+        elif command == 'position':
+            await self.stop()
+            try:
+                self.set_position(args)
+            except ValueError as error:
+                # an illegal move or bad FEN keeps the previous position
+                self.send(f"info string ignored position: {error}")
+        elif command == 'go':
+            await self.stop()
+            try:
+                limits = parse_go(args)
+            except (ValueError, TypeError) as error:
+                self.send(f"info string ignored go: {error}")
+            else:
+                self.go(*limits)
+        elif command == 'stop':
+            await self.stop()
+        elif command == 'ponderhit':
+            self.ponderhit()
+        elif command == 'quit':
+            return False
+        return True
+
+    def set_option(self, args):
+        # setoption name <name words> [value <value words>]
+        if 'name' not in args:
+            return
+        if 'value' in args:
+            split = args.index('value')
+            name, value = ' '.join(args[args.index('name') + 1:split]), ' '.join(args[split + 1:])
+        else:
+            name, value = ' '.join(args[args.index('name') + 1:]), None
+        for option, (kind, default, _) in OPTIONS.items():
+            if option.lower() == name.lower():
+                if kind == 'spin':
+                    value = int(value)
+                elif kind == 'check':
+                    value = value == 'true'
+                self.options[option] = value
+                if option == 'SyzygyPath':
+                    self.load_tablebase(value)
+                return
+
+    def load_tablebase(self, path):
+        if self.tablebase is not None:
+            self.tablebase.close()
+        self.tablebase = None
+        if path and path != '<empty>':
+            try:
+                self.tablebase = Tablebase(path)
+            except OSError as error:
+                # a mistyped path in the GUI leaves the engine running without tables
+                self.send(f"info string cannot open Syzygy tables at {path}: {error}")
+        self.mm.tablebase = self.mcts.tablebase = self.puct.tablebase = self.tablebase
+
+    def set_position(self, args):
+        if not args:
+            return
+        if args[0] == 'startpos':
+            board, rest = chess.Board(), args[1:]
+        elif args[0] == 'fen':
+            end = args.index('moves') if 'moves' in args else len(args)
+            board, rest = chess.Board(' '.join(args[1:end])), args[end:]
+        else:
+            return
+        if rest and rest[0] == 'moves':
+            for uci in rest[1:]:
+                board.push_uci(uci)
+        self.board = board
+
+    def go(self, limits, depth, infinite, ponder):
+        turn = self.board.turn
+        if infinite or ponder:
+            # no deadlines until stop, or ponderhit starts the real clock
+            self.clock = TimeManager()
+            self.ponder_limits = limits if ponder else None
+        else:
+            self.clock = TimeManager(limits, turn) if limits else TimeManager()
+            self.ponder_limits = None
+        self.release = asyncio.Event()
+        if not (infinite or ponder):
+            self.release.set()
+        # a bare "go" uses the configured budget, anything else searches until told or timed out
+        bounded = not (limits or infinite or ponder)
+        if depth is None:
+            depth = self.options['Depth'] if bounded else MAX_DEPTH
+        iterations = self.options['Iterations'] if bounded else MAX_ITERATIONS
+        self.search_task = asyncio.ensure_future(self.search(self.board.copy(), depth, iterations, self.clock))
+
+    def ponderhit(self):
+        # the opponent played the expected move: the ponder search becomes the real one
+        if self.clock is None or self.release is None:
+            return
+        if self.ponder_limits is not None:
+            self.clock.restart(self.ponder_limits, self.board.turn)
+            self.ponder_limits = None
+        self.release.set()
+
+    async def stop(self):
+        # bestmove is sent by the search task once the worker thread has unwound
+        if self.search_task is None:
+            return
+        self.clock.stop()
+        self.release.set()
+        await self.search_task
+
+    async def search(self, board, depth, iterations, clock):
+        loop = asyncio.get_running_loop()
+        move, ponder, info = await loop.run_in_executor(self.executor, self.think, board, depth, iterations, clock)
+        # the protocol forbids bestmove during ponder/infinite until stop or ponderhit
+        await self.release.wait()
+        self.search_task = None
+        if info:
+            self.send("info " + info)
+        if move is None:
+            self.send("bestmove 0000")
+        elif ponder is not None and self.options['Ponder']:
+            self.send(f"bestmove {move.uci()} ponder {ponder.uci()}")
+        else:
+            self.send(f"bestmove {move.uci()}")
+
+    def think(self, board, depth, iterations, clock):
+        # runs in the worker thread, engine prints go to stderr to keep stdout UCI only
+        stdout, sys.stdout = sys.stdout, sys.stderr
+        try:
+            if self.options['Engine'] == 'mcts':
+                return self.think_mcts(self.mcts, board, iterations, clock)
+            if self.options['Engine'] == 'puct':
+                return self.think_mcts(self.puct, board, iterations, clock)
+            return self.think_minimax(board, depth, clock)
+        finally:
+            sys.stdout = stdout
+
+    def principal_variation(self, board, move, length):
+        # our move followed by the hash moves of the positions after it
+        board = board.copy()
+        pv = [move]
+        board.push(move)
+        while len(pv) < length:
+            entry = self.tt.lookup(zobrist_hash(board))
+            if entry is None or entry.move is None or not board.is_legal(entry.move):
+                break
+            pv.append(entry.move)
+            board.push(entry.move)
+        return pv
+
+    def think_minimax(self, board, depth, clock):
+        reported = None  # (move, nodes) of the last per-depth info line
+
+        def progress(move, depth, nodes):
+            # one info line per finished depth, the score is that depth's root best
+            nonlocal reported
+            score = self.mm.root_best[1]
+            if move is None or score is None:
+                return
+            reported = (move, nodes)
+            elapsed = clock.elapsed()
+            pv = ' '.join(m.uci() for m in self.principal_variation(board, move, depth))
+            self.send(f"info depth {depth} score {format_score(score)} nodes {nodes}"
+                      f" nps {int(nodes / elapsed) if elapsed else 0} time {int(elapsed * 1000)} pv {pv}")
+
+        self.mm.progress = progress
+        try:
+            move, score = self.mm.predict_iddfs(board, max_depth=depth, clock=clock)
+        finally:
+            self.mm.progress = None
+        if move is None:
+            # no legal moves: mated, or a draw by stalemate
+            return None, None, f"depth 0 score {'mate 0' if board.is_checkmate() else 'cp 0'}"
+        reached = self.mm.depth_times[-1][0] if self.mm.depth_times else 0
+        pv = self.principal_variation(board, move, max(reached, 2))
+        ponder = pv[1] if len(pv) > 1 else None  # the expected reply is the hash move after ours
+        if reported == (move, self.mm.nodes):
+            return move, ponder, None  # the search ended on a full depth, its line said it all
+        # a book or tablebase move, or a depth cut short by the clock
+        info = (f"depth {reached} score {format_score(score if score is not None else 0)} nodes {self.mm.nodes}"
+                f" nps {int(self.mm.nps())} time {int(self.mm.elapsed * 1000)}")
+        return move, ponder, info + " pv " + ' '.join(m.uci() for m in pv)
+
+    def think_mcts(self, engine, board, iterations, clock):
+        tree = engine.advance_root(board)
+        start = int(tree.visits[ROOT])  # visits kept from the previous search are not ours
+
+        def progress(move, depth, visits):
+            self.send(f"info depth {depth} nodes {visits - start} time {int(clock.elapsed() * 1000)} pv {move.uci()}")
+
+        engine.progress = progress
+        try:
+            move = engine.predict(tree, iterations=iterations, clock=clock)
+        finally:
+            engine.progress = None
+        ponder = None
+        child = tree.find_child(ROOT, move) if move is not None else NO_NODE
+        if child != NO_NODE and tree.num_children[child]:
+            # most visited reply in the subtree of our move
+            reply = max(tree.children(child), key=lambda node: tree.visits[node])
+            ponder = tree.get_move(reply)
+        nodes = int(tree.visits[ROOT]) - start
+        elapsed = clock.elapsed()
+        info = f"nodes {nodes} nps {int(nodes / elapsed) if elapsed else 0} time {int(elapsed * 1000)}"
+        return move, ponder, info
+
+
+def main():
+    asyncio.run(UCIEngine().run())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
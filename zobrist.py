@@ -0,0 +1,91 @@
+import chess
+import chess.polyglot
+
+# Use the polyglot random numbers so keys match chess.polyglot.zobrist_hash
+RANDOM_ARRAY = chess.polyglot.POLYGLOT_RANDOM_ARRAY
+PIECE_TYPES = [chess.PAWN, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN, chess.KING]
+
+def zobrist_hash(board):
+    return chess.polyglot.zobrist_hash(board)
+
+def state_key(board):
+    # castling rights, en passant file and side to move
+    key = 0
+    castling = board.castling_rights
+    if castling & chess.BB_H1: key ^= RANDOM_ARRAY[768]
+    if castling & chess.BB_A1: key ^= RANDOM_ARRAY[769]
+    if castling & chess.BB_H8: key ^= RANDOM_ARRAY[770]
+    if castling & chess.BB_A8: key ^= RANDOM_ARRAY[771]
+
+    ep_square = board.ep_square
+    if ep_square is not None:
+        # only hash the file if a pawn is ready to capture (same as polyglot)
+        if board.turn == chess.WHITE:
+            ep_mask = chess.shift_down(chess.BB_SQUARES[ep_square])
+        else:
+            ep_mask = chess.shift_up(chess.BB_SQUARES[ep_square])
+        ep_mask = chess.shift_left(ep_mask) | chess.shift_right(ep_mask)
+        if ep_mask & board.pawns & board.occupied_co[board.turn]:
+            key ^= RANDOM_ARRAY[772 + chess.square_file(ep_square)]
+
+    if board.turn == chess.WHITE:
+        key ^= RANDOM_ARRAY[780]
+    return key
+
+def piece_bitboards(board):
+    white, black = board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK]
+    return (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings, black, white)
+
+def piece_key_delta(before, after):
+    # xor of every piece that appeared or disappeared between two snapshots
+    key = 0
+    for i in range(6):
+        for pivot in (0, 1):
+            changed = (before[i] & before[6 + pivot]) ^ (after[i] & after[6 + pivot])
+            if changed:
+                offset = 64 * (i * 2 + pivot)
+                for square in chess.scan_forward(changed):
+                    key ^= RANDOM_ARRAY[offset + square]
+    return key
+
+
+class ZobristBoard(chess.Board):
+    # chess.Board that keeps its 64-bit Zobrist key up to date on push/pop
+    # instead of hashing the full position (or formatting a FEN) at every node
+
+    def clear_stack(self):
+        super().clear_stack()
+        self._key_stack = []
+        self.zobrist_key = zobrist_hash(self)
+
+    def push(self, move):
+        self._key_stack.append(self.zobrist_key)
+        before = piece_bitboards(self)
+        key = self.zobrist_key ^ state_key(self)
+        super().push(move)
+        self.zobrist_key = key ^ state_key(self) ^ piece_key_delta(before, piece_bitboards(self))
+
+    def pop(self):
+        move = super().pop()
+        self.zobrist_key = self._key_stack.pop()
+        return move
+
+    def copy(self, *, stack=True):
+        board = super().copy(stack=stack)
+        board.zobrist_key = self.zobrist_key
+        if stack:
+            stack = len(self.move_stack) if stack is True else stack
+            board._key_stack = self._key_stack[-stack:] if stack else []
+        else:
+            board._key_stack = []
+        return board
+
+    @classmethod
+    def from_board(cls, board):
+        if isinstance(board, cls):
+            return board.copy()
+        # replay the game so repetition detection still works
+        new_board = cls(board.root().fen(), chess960=board.chess960)
+        for move in board.move_stack:
+            new_board.push(move)
+        return new_board